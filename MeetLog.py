@@ -2,9 +2,11 @@
 MeetLog - 会議録音・議事録作成支援ツール
 Google NotebookLM連携対応版
 """
-import os
 import time
-import soundcard as sc
+_PROCESS_START = time.perf_counter()  # 起動時間計測の基準
+import os
+import importlib
+import importlib.util
 import soundfile as sf
 import tkinter as tk
 from tkinter import messagebox, filedialog
@@ -17,40 +19,70 @@ import sys
 import shutil
 import warnings
 import webbrowser
-from PIL import Image
 import glob
 from types import SimpleNamespace
 from datetime import datetime
-from pydub import AudioSegment
+from concurrent.futures import ThreadPoolExecutor
+from collections import deque
 import json
 import queue
 import base64
+import io
+import hashlib
+import difflib
+import re
+import sqlite3
 
-# Gemini / 音声認識
-try:
-    import google.generativeai as genai
-    GEMINI_AVAILABLE = True
-except ImportError:
-    GEMINI_AVAILABLE = False
-
-try:
-    import speech_recognition as sr
-    SPEECH_RECOGNITION_AVAILABLE = True
-except ImportError:
-    SPEECH_RECOGNITION_AVAILABLE = False
+# ===== 遅延インポート =====
+class LazyModule:
+    """初回の属性アクセス時に import するモジュールの代理（起動を速くするため）"""
+    def __init__(self, *names):
+        self._names = names
+        self._module = None
+        self._lock = threading.Lock()
+    
+    def _load(self):
+        if self._module is None:
+            with self._lock:
+                if self._module is None:
+                    error = None
+                    for name in self._names:
+                        try:
+                            self._module = importlib.import_module(name)
+                            break
+                        except ImportError as e:
+                            error = e
+                    else:
+                        raise error
+        return self._module
+    
+    def __getattr__(self, attr):
+        return getattr(self._load(), attr)
 
-# WASAPI ループバック用
-try:
-    import pyaudiowpatch as pyaudio
-    WASAPI_AVAILABLE = True
-except ImportError:
+def module_available(name):
+    """モジュールを import せずにインストール有無だけ調べる"""
     try:
-        import pyaudio
-        WASAPI_AVAILABLE = False
-    except ImportError:
-        pyaudio = None
-        WASAPI_AVAILABLE = False
+        return importlib.util.find_spec(name) is not None
+    except (ImportError, ValueError):
+        return False
 
+# 録音デバイス
+sc = LazyModule("soundcard")
+
+# Gemini / 音声認識
+genai = LazyModule("google.generativeai")
+GEMINI_AVAILABLE = module_available("google.generativeai")
+
+sr = LazyModule("speech_recognition")
+SPEECH_RECOGNITION_AVAILABLE = module_available("speech_recognition")
+
+# ローカル音声認識（オフライン）
+vosk = LazyModule("vosk")
+VOSK_AVAILABLE = module_available("vosk")
+
+# WASAPI ループバック用
+pyaudio = LazyModule("pyaudiowpatch", "pyaudio")
+WASAPI_AVAILABLE = module_available("pyaudiowpatch")
 
 warnings.filterwarnings("ignore", message="data discontinuity in recording", category=Warning)
 warnings.filterwarnings("ignore", category=UserWarning, module='soundcard')
@@ -65,8 +97,62 @@ SETTINGS.recording.sample_rate = 44100
 SETTINGS.recording.buffer_size = SETTINGS.recording.sample_rate // 2
 SETTINGS.recording.mic_delay_ms = -50
 SETTINGS.recording.max_duration_seconds = 7200
+SETTINGS.recording.spill_block_seconds = 5  # ディスクへ書き出すブロック長（秒）
+SETTINGS.recording.journal_fsync_interval = 10  # ジャーナルを fsync する間隔（秒）
+SETTINGS.recording.drift_warmup_seconds = 30  # クロックずれ補正を始めるまでの計測時間（秒）
+SETTINGS.recording.drift_window_seconds = 120  # クロックずれを推定する直近の区間（秒）
+SETTINGS.recording.drift_max_ppm = 2000  # クロックずれ補正の上限（ppm）
+SETTINGS.recording.capture_queue_slots = 16  # キャプチャキューのスロット数（1スロット≒0.5秒）
+SETTINGS.recording.hub_reader_seconds = 10  # 共有ストリームの読み手ごとに保持する最大秒数
+SETTINGS.recording.sync_tolerance_ms = 30  # タイムライン位置のずれを補正するしきい値（ms）
+SETTINGS.recording.sync_smoothing = 0.05  # 位置のずれを平滑化する係数（小さいほど読み出しの揺らぎに鈍感）
+SETTINGS.recording.auto_mic_delay = False  # 保存時にマイク遅延を自動推定する
+SETTINGS.recording.auto_delay_min_correlation = 0.1  # 自動推定を採用する最小の正規化相関
+SETTINGS.recording.system_weight = 1.2  # ミックス時のシステム音声の重み
+SETTINGS.recording.peak_limit = 0.95  # ミックス後のピーク上限
+SETTINGS.recording.mix_block_frames = 65536  # ミックス処理のブロック長（サンプル）
+SETTINGS.recording.live_encode = False  # 録音中にMP3へエンコードする
+SETTINGS.recording.live_encode_interval = 5  # 録音中エンコードの間隔（秒）
+SETTINGS.recording.live_encode_margin = 2  # 録音中エンコードで最新のキャプチャ位置から空ける秒数
+SETTINGS.vad = SimpleNamespace()
+SETTINGS.vad.threshold = 0.02  # 無音判定の閾値（平均絶対値）
+SETTINGS.vad.silence_duration = 0.8  # 発話終了とみなす無音の長さ（秒）
+SETTINGS.vad.frame_ms = 20
+SETTINGS.vad.zcr_max = None  # ゼロ交差率の上限（Noneで無効）
+SETTINGS.vad.flatness_max = None  # スペクトル平坦度の上限（Noneで無効）
+SETTINGS.transcription = SimpleNamespace()
+SETTINGS.transcription.sample_rate = 16000  # Gemini送信用のサンプルレート
+SETTINGS.transcription.chunk_format = "flac"  # "wav16k" / "flac" / "opus"
+SETTINGS.transcription.mic_engine = "google"  # マイクの文字起こし: "google" / "vosk"
+SETTINGS.transcription.system_engine = "gemini"  # システム音声の文字起こし: "gemini" / "vosk"
+SETTINGS.transcription.vosk_model_path = "./models/vosk-model-small-ja-0.22"
+SETTINGS.transcription.stream_frame_ms = 200  # ローカルエンジンへ渡すフレーム長（ms）
+SETTINGS.transcription.target_latency_seconds = 15  # 発話から字幕表示までの目標時間（秒）
+SETTINGS.transcription.min_chunk_seconds = 4  # システム音声チャンクの最短（秒）
+SETTINGS.transcription.max_chunk_seconds = 30  # システム音声チャンクの最長（秒）
+SETTINGS.transcription.file_window_seconds = 300  # 音声ファイルを区切る長さ（秒）
+SETTINGS.transcription.file_overlap_seconds = 5  # 区間どうしの重なり（秒）
+SETTINGS.transcription.file_search_seconds = 30  # 区切り位置の無音を探す範囲（秒）
+SETTINGS.transcription.workers = 3  # 同時に実行する文字起こしリクエスト数
+SETTINGS.transcription.max_pending = 6  # 処理中・順番待ちセグメントの上限
+SETTINGS.devices = SimpleNamespace()
+SETTINGS.devices.poll_seconds = 3  # デバイスの抜き差しを確認する間隔（秒）
+SETTINGS.gemini = SimpleNamespace()
+SETTINGS.gemini.validation_ttl_hours = 24  # モデル選択・接続確認結果を再利用する期間（時間）
+SETTINGS.assistant = SimpleNamespace()
+SETTINGS.assistant.direct_chars = 12000  # これ以下の文字起こしは要約せずにそのまま送る
+SETTINGS.assistant.section_chars = 6000  # 区間要約1回あたりの文字数の目安
+SETTINGS.assistant.map_workers = 4  # 区間要約を同時に実行する数
+SETTINGS.assistant.section_cache_size = 512  # 区間要約のキャッシュ件数
+SETTINGS.assistant.memory_chars = 1500  # 次のリクエストへ引き継ぐ前回の議事録の要点の上限（文字）
+SETTINGS.assistant.response_cache_mb = 50  # AI出力キャッシュの上限サイズ（MB）
+SETTINGS.assistant.usage_log_size = 200  # 保持するリクエストごとのトークン記録の件数
+SETTINGS.ui = SimpleNamespace()
+SETTINGS.ui.refresh_hz = 20  # ワーカースレッドからの表示更新の頻度
+SETTINGS.ui.startup_budget_ms = 1500  # 起動からウィンドウ表示までの目標時間（ms）
 SETTINGS.paths = SimpleNamespace()
 SETTINGS.paths.recordings = "./recordings"
+SETTINGS.paths.cache = "./cache"
 
 # ===== テーマ（落ち着いたダーク）=====
 THEME = SimpleNamespace()
@@ -132,21 +218,28 @@ pause = False
 recording_start_time = None
 mic_buffer = None
 system_buffer = None
+system_vad = None  # システム音声の発話区間検出
+mic_hub = None  # マイク音声を録音以外の利用者へ分配
+system_hub = None
+mic_queue = None  # キャプチャスレッド → 録音バッファ
+system_queue = None
+session_clock = None  # 録音セッションの共通タイムライン
+ui_channel = None  # ワーカースレッド → UI の更新チャネル
 input_source_id = None
 system_source_id = None
 last_recording_path = None
-wasapi_device_index = None  # WASAPIループバック用
 
 # Gemini関連
 gemini_api_key = ""
 gemini_model = None
 gemini_enabled = False
+gemini_validation = {}  # 接続確認のキャッシュ（key_fingerprint / model / validated_at）
 transcript_queue = queue.Queue()
 current_transcript = []
 
 # ===== 設定ファイル読み込み =====
 def load_settings():
-    global gemini_api_key, gemini_enabled
+    global gemini_api_key, gemini_enabled, gemini_model, gemini_validation
     settings_path = os.path.join(os.path.dirname(__file__), "settings.json")
     if os.path.exists(settings_path):
         try:
@@ -155,6 +248,12 @@ def load_settings():
                 if 'gemini' in data:
                     gemini_api_key = data['gemini'].get('api_key', '')
                     gemini_enabled = data['gemini'].get('enabled', False)
+                    gemini_model = data['gemini'].get('model')
+                    gemini_validation = data['gemini'].get('validation', {})
+                transcription = data.get('transcription', {})
+                for key in ('mic_engine', 'system_engine', 'vosk_model_path', 'target_latency_seconds'):
+                    if key in transcription:
+                        setattr(SETTINGS.transcription, key, transcription[key])
         except: pass
 
 def save_settings():
@@ -166,25 +265,155 @@ def save_settings():
             "backup_interval": 60,
             "silence_threshold": 0.05
         },
+        "transcription": {
+            "mic_engine": SETTINGS.transcription.mic_engine,
+            "system_engine": SETTINGS.transcription.system_engine,
+            "vosk_model_path": SETTINGS.transcription.vosk_model_path,
+            "target_latency_seconds": SETTINGS.transcription.target_latency_seconds
+        },
         "gemini": {
             "api_key": gemini_api_key,
-            "model": "gemini-1.5-flash",
-            "enabled": gemini_enabled
+            "model": gemini_model or "gemini-1.5-flash",
+            "enabled": gemini_enabled,
+            "validation": gemini_validation
         }
     }
     with open(settings_path, 'w', encoding='utf-8') as f:
         json.dump(data, f, indent=4, ensure_ascii=False)
 
 # ===== Gemini Assistant =====
+def api_key_fingerprint(api_key):
+    """APIキーを保存せずに識別するための短いハッシュ"""
+    return hashlib.sha256(api_key.encode('utf-8')).hexdigest()[:16]
+
+def cached_gemini_model(fingerprint, now=None):
+    """同じAPIキーで有効期限内に確認済みのモデル名（なければ None）"""
+    cache = gemini_validation or {}
+    if cache.get("key_fingerprint") != fingerprint or not cache.get("model"):
+        return None
+    age = (now or time.time()) - cache.get("validated_at", 0)
+    if not 0 <= age <= SETTINGS.gemini.validation_ttl_hours * 3600:
+        return None
+    return cache["model"]
+
+def split_transcript_sections(text, max_chars=None):
+    """文字起こしを段落（空行区切り）単位で max_chars 程度の区間に分ける
+
+    先頭から順に詰めるので、末尾に追記しても前の区間の中身は変わらない。
+    """
+    max_chars = max_chars or SETTINGS.assistant.section_chars
+    sections, current, size = [], [], 0
+    for paragraph in text.split("\n\n"):
+        if not paragraph.strip():
+            continue
+        if current and size + len(paragraph) > max_chars:
+            sections.append("\n\n".join(current))
+            current, size = [], 0
+        current.append(paragraph)
+        size += len(paragraph) + 2
+    if current:
+        sections.append("\n\n".join(current))
+    return sections
+
+def section_time_range(section):
+    """区間内の [HH:MM:SS] から「開始〜終了」を返す（なければ空文字）"""
+    stamps = re.findall(r"\[(\d{2}:\d{2}:\d{2})\]", section)
+    if not stamps:
+        return ""
+    return stamps[0] if stamps[0] == stamps[-1] else f"{stamps[0]}〜{stamps[-1]}"
+
+class GenerationCancelled(Exception):
+    """ストリーミング生成が途中で取り消された"""
+
+# プロンプトの文面を変えたら上げる（古いキャッシュを使わないため）
+PROMPT_VERSIONS = {"minutes": 1, "questions": 1, "summary": 1}
+
+class ResponseCache:
+    """AIアシスタントの出力をキーごとに保存する SQLite のキャッシュ
+
+    キーは (タスク, モデル, プロンプトの版, 文字起こしのハッシュ) から作る。
+    合計サイズが max_bytes を超えたら最後に使われたのが古いものから消す（LRU）。
+    hits / misses はパネルの表示用。
+    """
+    def __init__(self, path=None, max_bytes=None):
+        self.path = path or os.path.join(SETTINGS.paths.cache, "responses.sqlite3")
+        self.max_bytes = max_bytes or int(SETTINGS.assistant.response_cache_mb * 1024 * 1024)
+        self.lock = threading.Lock()
+        self.conn = None
+        self.hits = 0
+        self.misses = 0
+    
+    def _connect(self):
+        if self.conn is None:
+            os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+            self.conn = sqlite3.connect(self.path, check_same_thread=False)
+            self.conn.execute("""CREATE TABLE IF NOT EXISTS responses (
+                key TEXT PRIMARY KEY, task TEXT, value TEXT, size INTEGER, last_used REAL)""")
+        return self.conn
+    
+    @staticmethod
+    def make_key(task, model, version, transcript_text, extra=""):
+        digest = hashlib.sha256(transcript_text.encode('utf-8')).hexdigest()
+        return hashlib.sha256(f"{task}\n{model}\n{version}\n{digest}\n{extra}".encode('utf-8')).hexdigest()
+    
+    def get(self, key):
+        with self.lock:
+            try:
+                conn = self._connect()
+                row = conn.execute("SELECT value FROM responses WHERE key = ?", (key,)).fetchone()
+                if row is None:
+                    self.misses += 1
+                    return None
+                conn.execute("UPDATE responses SET last_used = ? WHERE key = ?", (time.time(), key))
+                conn.commit()
+                self.hits += 1
+                return row[0]
+            except sqlite3.Error as e:
+                print(f"Response cache error: {e}")
+                return None
+    
+    def put(self, key, task, value):
+        with self.lock:
+            try:
+                conn = self._connect()
+                size = len(value.encode('utf-8'))
+                conn.execute("INSERT OR REPLACE INTO responses VALUES (?, ?, ?, ?, ?)",
+                    (key, task, value, size, time.time()))
+                self._evict(conn)
+                conn.commit()
+            except sqlite3.Error as e:
+                print(f"Response cache error: {e}")
+    
+    def _evict(self, conn):
+        total = conn.execute("SELECT COALESCE(SUM(size), 0) FROM responses").fetchone()[0]
+        if total <= self.max_bytes:
+            return
+        for key, size in conn.execute("SELECT key, size FROM responses ORDER BY last_used").fetchall():
+            conn.execute("DELETE FROM responses WHERE key = ?", (key,))
+            total -= size
+            if total <= self.max_bytes:
+                break
+    
+    def stats_text(self):
+        lookups = self.hits + self.misses
+        return f"💾 キャッシュ {self.hits}/{lookups}" if lookups else ""
+
 class GeminiAssistant:
     def __init__(self):
         self.model = None
-        self.chat = None
         self.is_configured = False
         self.last_error = ""  # エラー詳細を保存
-        
-    def configure(self, api_key):
-        global gemini_api_key
+        self.section_cache = {}  # 区間テキストのハッシュ -> 区間要約
+        self.cache_lock = threading.Lock()
+        # リクエストは毎回独立（チャット履歴は使わない）。引き継ぐのはこの要点だけ
+        self.memory = ""
+        self.usage_log = []  # リクエストごとのトークン数
+        self.usage_totals = {}  # タスク -> 合計トークン数
+        self.response_cache = ResponseCache()
+        
+    def configure(self, api_key, revalidate=False):
+        """APIキーを設定。キャッシュが有効なら list_models / テスト送信を省略する"""
+        global gemini_api_key, gemini_model, gemini_validation
         self.last_error = ""
         if not GEMINI_AVAILABLE:
             self.last_error = "Gemini library not available"
@@ -196,36 +425,27 @@ class GeminiAssistant:
             return False
         try:
             genai.configure(api_key=api_key)
-            # 利用可能なモデルをリストアップ
-            available_models = []
-            for m in genai.list_models():
-                if 'generateContent' in m.supported_generation_methods:
-                    available_models.append(m.name)
-            print(f"Available models: {available_models[:5]}...")
-            
-            # 優先順位でモデルを選択
-            preferred = ['gemini-2.5-flash', 'gemini-2.0-flash', 'gemini-1.5-flash', 'gemini-1.5-pro', 'gemini-pro']
-            selected_model = None
-            for pref in preferred:
-                for avail in available_models:
-                    if pref in avail:
-                        selected_model = avail.replace('models/', '')
-                        break
-                if selected_model:
-                    break
-            
-            if not selected_model and available_models:
-                selected_model = available_models[0].replace('models/', '')
-            
-            print(f"Using model: {selected_model}")
-            self.model = genai.GenerativeModel(selected_model)
-            
-            # テストメッセージを送信して接続確認
-            test_response = self.model.generate_content("Hello")
-            print(f"Test response: {test_response.text[:50] if test_response.text else 'empty'}")
-            self.chat = self.model.start_chat(history=[])
+            fingerprint = api_key_fingerprint(api_key)
+            selected_model = None if revalidate else cached_gemini_model(fingerprint)
+            if selected_model:
+                print(f"Using cached model: {selected_model}")
+                self.model = genai.GenerativeModel(selected_model)
+            else:
+                selected_model = self._discover_model()
+                print(f"Using model: {selected_model}")
+                self.model = genai.GenerativeModel(selected_model)
+                
+                # テストメッセージを送信して接続確認
+                test_response = self.model.generate_content("Hello")
+                print(f"Test response: {test_response.text[:50] if test_response.text else 'empty'}")
+                gemini_validation = {
+                    "key_fingerprint": fingerprint,
+                    "model": selected_model,
+                    "validated_at": time.time(),
+                }
             self.is_configured = True
             gemini_api_key = api_key
+            gemini_model = selected_model
             save_settings()
             return True
         except Exception as e:
@@ -234,15 +454,145 @@ class GeminiAssistant:
             traceback.print_exc()
             return False
     
-    def generate_minutes(self, transcript_text):
-        """議事録を生成"""
+    def _discover_model(self):
+        """利用可能なモデルから優先順位で1つ選ぶ"""
+        available_models = []
+        for m in genai.list_models():
+            if 'generateContent' in m.supported_generation_methods:
+                available_models.append(m.name)
+        print(f"Available models: {available_models[:5]}...")
+        
+        preferred = ['gemini-2.5-flash', 'gemini-2.0-flash', 'gemini-1.5-flash', 'gemini-1.5-pro', 'gemini-pro']
+        for pref in preferred:
+            for avail in available_models:
+                if pref in avail:
+                    return avail.replace('models/', '')
+        
+        if available_models:
+            return available_models[0].replace('models/', '')
+        return None
+    
+    def _generate(self, task, prompt, on_delta=None, cancel=None):
+        """1回分のリクエストを送り、タスクごとにトークン数を記録して応答テキストを返す
+
+        on_delta を渡すとストリーミングで受け取り、届いた差分テキストごとに呼ぶ。
+        cancel（threading.Event）がセットされたら受信をやめて GenerationCancelled を送出する。
+        """
+        if on_delta is None:
+            response = self.model.generate_content(prompt)
+            text = response.text
+        else:
+            response = self.model.generate_content(prompt, stream=True)
+            parts = []
+            for delta in self.iter_deltas(response, cancel):
+                parts.append(delta)
+                on_delta(delta)
+            text = "".join(parts)
+        usage = getattr(response, "usage_metadata", None)
+        entry = {
+            "task": task,
+            "time": time.time(),
+            "prompt_tokens": getattr(usage, "prompt_token_count", None),
+            "output_tokens": getattr(usage, "candidates_token_count", None),
+            "total_tokens": getattr(usage, "total_token_count", None),
+        }
+        with self.cache_lock:
+            self.usage_log.append(entry)
+            del self.usage_log[:-SETTINGS.assistant.usage_log_size]
+            self.usage_totals[task] = self.usage_totals.get(task, 0) + (entry["total_tokens"] or 0)
+        print(f"Gemini [{task}] tokens: prompt={entry['prompt_tokens']} output={entry['output_tokens']}")
+        return text
+    
+    @staticmethod
+    def iter_deltas(response, cancel=None):
+        """ストリーミング応答から差分テキストを順に返すジェネレータ"""
+        for chunk in response:
+            if cancel is not None and cancel.is_set():
+                raise GenerationCancelled()
+            try:
+                text = chunk.text
+            except ValueError:
+                continue  # テキストを含まないチャンク（安全性情報のみなど）
+            if text:
+                yield text
+        if cancel is not None and cancel.is_set():
+            raise GenerationCancelled()
+    
+    def remember(self, text):
+        """次のリクエストへ引き継ぐ要点を更新（memory_chars で打ち切る）"""
+        limit = SETTINGS.assistant.memory_chars
+        self.memory = text if len(text) <= limit else text[:limit] + "…"
+    
+    def memory_block(self):
+        """プロンプトに添える引き継ぎ情報（なければ空文字）"""
+        if not self.memory:
+            return ""
+        return f"""
+【参考: 前回作成した議事録の要点】
+{self.memory}
+"""
+    
+    def response_key(self, task, transcript_text):
+        """出力キャッシュのキー（疑問点は引き継ぎ情報も結果に影響するので含める）"""
+        extra = self.memory if task == "questions" else ""
+        return ResponseCache.make_key(task, self.model.model_name, PROMPT_VERSIONS[task], transcript_text, extra)
+    
+    def cached_response(self, task, transcript_text):
+        """キャッシュ済みの出力（なければ None）。通信しないのでUIスレッドから呼べる"""
+        if not self.is_configured:
+            return None
+        result = self.response_cache.get(self.response_key(task, transcript_text))
+        if result is not None and task == "minutes":
+            self.remember(result)
+        return result
+    
+    def condense_transcript(self, transcript_text):
+        """長い文字起こしを区間ごとの要約に縮める（map段階）
+
+        (プロンプトに入れるテキスト, その見出し) を返す。短い場合はそのまま。
+        区間要約は内容のハッシュでキャッシュするので、追記後の再実行では
+        変わった末尾の区間だけを要約し直す。
+        """
+        if len(transcript_text) <= SETTINGS.assistant.direct_chars:
+            return transcript_text, "文字起こし"
+        sections = split_transcript_sections(transcript_text)
+        with ThreadPoolExecutor(max_workers=SETTINGS.assistant.map_workers) as executor:
+            summaries = list(executor.map(self._summarize_section, sections))
+        parts = []
+        for section, summary in zip(sections, summaries):
+            time_range = section_time_range(section)
+            parts.append(f"■ {time_range}\n{summary}" if time_range else f"■\n{summary}")
+        return "\n\n".join(parts), "区間ごとの要約（時系列順）"
+    
+    def _summarize_section(self, section):
+        key = hashlib.sha256(f"{self.model.model_name}\n{section}".encode('utf-8')).hexdigest()
+        with self.cache_lock:
+            if key in self.section_cache:
+                return self.section_cache[key]
+        prompt = f"""以下は長い会議の文字起こしの一部です。後で全体の議事録にまとめるため、この区間の内容を箇条書きで要約してください。
+話題、決定事項、議論の要点、アクションアイテム（担当者・期限）、未解決の疑問点を漏れなく残し、人名・数値・固有名詞はそのまま書いてください。
+
+{section}"""
+        summary = self._generate("section", prompt).strip()
+        with self.cache_lock:
+            self.section_cache[key] = summary
+            while len(self.section_cache) > SETTINGS.assistant.section_cache_size:
+                self.section_cache.pop(next(iter(self.section_cache)))
+        return summary
+    
+    def generate_minutes(self, transcript_text, use_cache=True, on_delta=None, cancel=None):
+        """議事録を生成（on_delta で差分を逐次受け取れる。取り消されたら None）"""
         if not self.is_configured:
             return "Gemini APIが設定されていません"
         try:
-            prompt = f"""以下の会議の文字起こしから、構造化された議事録を作成してください。
+            cached = self.cached_response("minutes", transcript_text) if use_cache else None
+            if cached is not None:
+                return cached
+            material, label = self.condense_transcript(transcript_text)
+            prompt = f"""以下の会議の{label}から、構造化された議事録を作成してください。
 
-【文字起こし】
-{transcript_text}
+【{label}】
+{material}
 
 【出力フォーマット】
 ## 議事録
@@ -260,21 +610,31 @@ class GeminiAssistant:
 
 ### 📌 次回への申し送り
 """
-            response = self.chat.send_message(prompt)
-            return response.text
+            if cancel is not None and cancel.is_set():
+                raise GenerationCancelled()
+            minutes = self._generate("minutes", prompt, on_delta, cancel)
+            self.response_cache.put(self.response_key("minutes", transcript_text), "minutes", minutes)
+            self.remember(minutes)
+            return minutes
+        except GenerationCancelled:
+            return None
         except Exception as e:
             return f"議事録生成エラー: {e}"
     
-    def suggest_questions(self, transcript_text):
+    def suggest_questions(self, transcript_text, use_cache=True, on_delta=None, cancel=None):
         """疑問点・確認事項を提案"""
         if not self.is_configured:
             return "Gemini APIが設定されていません"
         try:
+            cached = self.cached_response("questions", transcript_text) if use_cache else None
+            if cached is not None:
+                return cached
+            material, label = self.condense_transcript(transcript_text)
             prompt = f"""以下の会議内容から、参加者が確認すべき疑問点や懸念事項を抽出してください。
 
-【会議内容】
-{transcript_text}
-
+【会議内容（{label}）】
+{material}
+{self.memory_block()}
 【出力形式】
 以下の形式で5つ程度、見やすく出力してください：
 
@@ -293,66 +653,140 @@ class GeminiAssistant:
 ...
 
 各疑問点を区切り線で明確に分けてください。"""
-            response = self.chat.send_message(prompt)
-            return response.text
+            if cancel is not None and cancel.is_set():
+                raise GenerationCancelled()
+            questions = self._generate("questions", prompt, on_delta, cancel)
+            self.response_cache.put(self.response_key("questions", transcript_text), "questions", questions)
+            return questions
+        except GenerationCancelled:
+            return None
         except Exception as e:
             return f"疑問点生成エラー: {e}"
     
-    def summarize_realtime(self, transcript_text):
+    def summarize_realtime(self, transcript_text, use_cache=True, on_delta=None, cancel=None):
         """リアルタイム要約"""
         if not self.is_configured or not transcript_text.strip():
             return ""
         try:
+            cached = self.cached_response("summary", transcript_text) if use_cache else None
+            if cached is not None:
+                return cached
+            material, _ = self.condense_transcript(transcript_text)
             prompt = f"""以下の会議内容を3行以内で簡潔に要約してください。箇条書きで出力してください。
 
-{transcript_text}"""
-            response = self.model.generate_content(prompt)
-            return response.text
+{material}"""
+            if cancel is not None and cancel.is_set():
+                raise GenerationCancelled()
+            summary = self._generate("summary", prompt, on_delta, cancel)
+            self.response_cache.put(self.response_key("summary", transcript_text), "summary", summary)
+            return summary
+        except GenerationCancelled:
+            return None
         except Exception as e:
             return f"要約エラー: {e}"
     
+    def transcribe_chunk(self, audio_bytes, mime_type, stats=None):
+        """リアルタイム用の短い音声チャンクを文字起こし（発話がなければ空文字）
+
+        stats に dict を渡すと使用トークン数を "tokens" に入れる。
+        """
+        response = self.model.generate_content([
+            "この音声を日本語で文字起こししてください。話者の発言内容のみを正確に出力してください。音声がない場合や聞き取れない場合は「なし」と返してください。",
+            {
+                "mime_type": mime_type,
+                "data": base64.b64encode(audio_bytes).decode('utf-8')
+            }
+        ])
+        if stats is not None:
+            usage = getattr(response, "usage_metadata", None)
+            stats["tokens"] = getattr(usage, "total_token_count", None)
+        text = response.text.strip()
+        if text in ("なし", "空") or len(text) <= 2:
+            return ""
+        return text
+    
     def transcribe_audio_file(self, file_path, progress_callback=None):
-        """音声ファイルから文字起こしして議事録を生成"""
+        """音声ファイルから文字起こしして議事録を生成
+
+        長いファイルも扱えるよう、順次デコードして無音の位置で重なりのある区間に
+        区切り、区間ごとに並列で文字起こししてからつなぎ合わせる。
+        """
         if not self.is_configured:
             return None, "Gemini APIが設定されていません"
         
-        try:
+        def report(msg):
             if progress_callback:
-                progress_callback("音声ファイルを読み込み中...")
+                progress_callback(msg)
+        
+        try:
+            report("音声ファイルを読み込み中...")
+            rate = SETTINGS.transcription.sample_rate
+            try:
+                total_seconds = sf.info(file_path).duration
+            except Exception:
+                total_seconds = None
             
-            with open(file_path, 'rb') as f:
-                audio_bytes = f.read()
+            pieces = []
+            done = [0]
+            windows = iter_audio_windows(iter_decoded_audio(file_path, rate), rate)
             
-            # ファイルサイズチェック（20MB以下）
-            if len(audio_bytes) > 20 * 1024 * 1024:
-                return None, "ファイルサイズが大きすぎます（20MB以下にしてください）"
+            def transcribe(window):
+                """(テキスト, 失敗したか) を返す"""
+                audio_bytes, mime_type = encode_audio_chunk(window.audio, rate)
+                window.audio = None  # エンコード後は不要
+                for attempt in range(2):
+                    try:
+                        return transcribe_bytes(audio_bytes, mime_type), False
+                    except Exception as e:
+                        error = e
+                        print(f"Window transcription error (attempt {attempt + 1}): {e}")
+                return f"（この区間は文字起こしできませんでした: {error}）", True
             
-            # MIMEタイプを判定
-            ext = os.path.splitext(file_path)[1].lower()
-            mime_types = {'.mp3': 'audio/mp3', '.wav': 'audio/wav', '.m4a': 'audio/mp4', '.ogg': 'audio/ogg'}
-            mime_type = mime_types.get(ext, 'audio/mp3')
+            def transcribe_bytes(audio_bytes, mime_type):
+                response = self.model.generate_content([
+                    "この音声を日本語で詳細に文字起こししてください。話者の発言をそのまま正確に書き起こしてください。音声がない場合や聞き取れない場合は「なし」と返してください。",
+                    {
+                        "mime_type": mime_type,
+                        "data": base64.b64encode(audio_bytes).decode('utf-8')
+                    }
+                ])
+                # 無音の区間では本文のない応答が返ることがある（response.text は例外になる）
+                if not any(getattr(getattr(c, "content", None), "parts", None) for c in (response.candidates or [])):
+                    return ""
+                text = response.text.strip()
+                if text in ("なし", "空"):
+                    return ""
+                return text
             
-            if progress_callback:
-                progress_callback("Geminiで文字起こし中...")
+            def on_result(window, result):
+                text, failed = result
+                pieces.append((window.start / rate, text, failed))
             
-            # 文字起こし
-            response = self.model.generate_content([
-                "この音声を日本語で詳細に文字起こししてください。話者の発言をそのまま正確に書き起こしてください。",
-                {
-                    "mime_type": mime_type,
-                    "data": base64.b64encode(audio_bytes).decode('utf-8')
-                }
-            ])
-            transcript = response.text.strip()
+            def on_done(window):
+                done[0] += 1
+                position = convert_seconds(window.end / rate)
+                if total_seconds:
+                    report(f"Geminiで文字起こし中... {position} / {convert_seconds(total_seconds)}（{done[0]}区間完了）")
+                else:
+                    report(f"Geminiで文字起こし中... {position}（{done[0]}区間完了）")
+            
+            pool = TranscriptionPool(transcribe, on_result, on_done=on_done)
+            report("Geminiで文字起こし中...")
+            for start, audio in windows:
+                # 順番待ちが上限に達したらデコードを止めて待つ（メモリを一定に保つ）
+                pool.submit(SimpleNamespace(audio=audio, start=start, end=start + len(audio)))
+            pool.shutdown(wait=True)
             
-            if not transcript or len(transcript) < 10:
+            # 失敗した区間の注記は表示用の文字起こしにだけ残し、議事録の入力には含めない
+            transcript = stitch_transcripts([(start, text) for start, text, _ in pieces])
+            spoken = stitch_transcripts([(start, text) for start, text, failed in pieces if not failed])
+            if not spoken or len(spoken) < 10:
                 return None, "音声から文字起こしできませんでした"
             
-            if progress_callback:
-                progress_callback("議事録を生成中...")
+            report("議事録を生成中...")
             
             # 議事録生成
-            minutes = self.generate_minutes(transcript)
+            minutes = self.generate_minutes(spoken)
             
             return {"transcript": transcript, "minutes": minutes}, None
             
@@ -372,41 +806,1073 @@ def format_file_size(size_bytes):
         size_bytes /= 1024
     return f"{size_bytes:.1f} TB"
 
-class RingBuffer:
-    def __init__(self, duration_seconds, sample_rate, channels=1):
+class ChunkedRecorder:
+    """録音データを固定サイズのブロック単位でセッションファイルへ書き出すバッファ
+
+    メモリ上には書き込み中のブロックと書き出し待ちのブロックだけを保持するため、
+    録音時間に関係なく常駐メモリは数MBに収まる。ファイルは float32 の生データ
+    （インターリーブ）で、異常終了時のジャーナルを兼ねる。いっぱいになった
+    ブロックは書き込みスレッドへ渡すので、録音スレッドはディスクI/Oを待たない。
+    """
+    def __init__(self, path, sample_rate, channels=1, block_seconds=None):
+        self.path = path
         self.sample_rate = sample_rate
         self.channels = channels
-        self.max_samples = int(duration_seconds * sample_rate)
-        self.buffer = np.zeros((self.max_samples, channels), dtype=np.float32)
-        self.write_pos = 0
+        if block_seconds is None:
+            block_seconds = SETTINGS.recording.spill_block_seconds
+        self.block_frames = int(block_seconds * sample_rate)
+        self.block = np.zeros((self.block_frames, channels), dtype=np.float32)
+        self.block_pos = 0
+        self.blocks_spilled = 0  # 書き込みスレッドへ渡したブロック数
+        self.blocks_on_disk = 0  # ファイルへ書き込み済みのブロック数
+        self.pending = {}  # ブロック番号 -> 書き込み待ちのブロック
         self.total_written = 0
+        self.peak = 0.0  # これまでに書き込まれたサンプルの最大絶対値
+        self.closed = False
         self.lock = threading.Lock()
+        self.file = open(path, 'wb')
+        self.journal = queue.Queue()
+        self.writer = threading.Thread(target=self._journal_loop, daemon=True)
+        self.writer.start()
     
-    def write(self, data):
+    def __len__(self):
+        return self.total_written
+    
+    def __getitem__(self, index):
+        """recorder[start:end] で read() と同じ範囲を返す（配列と同様に扱うため）"""
+        start, end, _ = index.indices(self.total_written)
+        return self.read(start, end)
+    
+    def write(self, data, position=None):
+        """data を追記し、data[0] が置かれたタイムライン位置を返す
+
+        position（キャプチャ時刻から求めた共通タイムライン上の位置）を渡すと、
+        許容範囲を超えるずれを無音の挿入または先頭の切り捨てで揃える。
+        """
         with self.lock:
-            if len(data) == 0:
-                return
+            start = self.total_written
+            if len(data) == 0 or self.closed:
+                return start
             if len(data.shape) == 1:
                 data = data.reshape(-1, 1)
             elif data.shape[1] != self.channels:
-                data = np.column_stack([data[:, 0]] * self.channels) if data.shape[1] > 0 else data
-            
-            remaining = len(data)
-            src_pos = 0
-            while remaining > 0:
-                space = self.max_samples - self.write_pos
-                to_write = min(remaining, space)
-                self.buffer[self.write_pos:self.write_pos + to_write] = data[src_pos:src_pos + to_write]
-                self.write_pos = (self.write_pos + to_write) % self.max_samples
-                self.total_written += to_write
-                remaining -= to_write
-                src_pos += to_write
-    
-    def get_all_data(self):
+                # 先頭チャンネルをブロードキャストして書き込む（コピーしない）
+                data = data[:, :1]
+            if position is not None:
+                gap = position - self.total_written
+                tolerance = int(self.sample_rate * SETTINGS.recording.sync_tolerance_ms / 1000)
+                if gap > tolerance:
+                    self._append(np.zeros((1, 1), dtype=np.float32), gap)
+                    start = position
+                elif gap < -tolerance:
+                    # すでに書き込まれた区間と重なる部分を捨てる
+                    start = position
+                    data = data[-gap:]
+                    if len(data) == 0:
+                        return start
+            self.peak = max(self.peak, float(data.max()), -float(data.min()))
+            self._append(data, len(data))
+            return start
+    
+    def _append(self, data, frames):
+        """frames サンプル分を追記（data が1行ならその値で埋める）"""
+        fill = len(data) == 1 and frames != 1
+        src_pos = 0
+        remaining = frames
+        while remaining > 0:
+            to_write = min(remaining, self.block_frames - self.block_pos)
+            self.block[self.block_pos:self.block_pos + to_write] = data if fill else data[src_pos:src_pos + to_write]
+            self.block_pos += to_write
+            self.total_written += to_write
+            remaining -= to_write
+            src_pos += to_write
+            if self.block_pos == self.block_frames:
+                self._spill()
+    
+    def _spill(self):
+        """いっぱいになったブロックを書き込みスレッドへ渡す"""
+        self.pending[self.blocks_spilled] = self.block
+        self.journal.put((self.blocks_spilled, self.block))
+        self.blocks_spilled += 1
+        self.block = np.empty_like(self.block)
+        self.block_pos = 0
+    
+    def _journal_loop(self):
+        """溜まったブロックをまとめて順に追記し、一定間隔で fsync する"""
+        interval = SETTINGS.recording.journal_fsync_interval
+        last_sync = time.monotonic()
+        dirty = False
+        finished = False
+        while not finished:
+            try:
+                batch = [self.journal.get(timeout=interval)]
+            except queue.Empty:
+                batch = []
+            while True:
+                try:
+                    batch.append(self.journal.get_nowait())
+                except queue.Empty:
+                    break
+            written = []
+            for entry in batch:
+                if entry is None:
+                    finished = True
+                    continue
+                index, block = entry
+                self.file.write(block)
+                if index is not None:
+                    written.append(index)
+            if batch:
+                self.file.flush()
+                dirty = True
+            with self.lock:
+                for index in written:
+                    self.pending.pop(index, None)
+                self.blocks_on_disk += len(written)
+            if dirty and (finished or time.monotonic() - last_sync >= interval):
+                os.fsync(self.file.fileno())
+                last_sync = time.monotonic()
+                dirty = False
+    
+    def read(self, start, end=None):
+        """タイムライン上の [start, end) のサンプルを返す（end省略時は最新まで）
+
+        ファイル上のブロックは必要な範囲だけを読み込み、メモリ上のブロックは
+        該当部分のみをコピーする。
+        """
+        bf = self.block_frames
+        with self.lock:
+            total = self.total_written
+            end = total if end is None else min(end, total)
+            start = max(0, min(start, end))
+            disk_frames = self.blocks_on_disk * bf
+            spilled_frames = self.blocks_spilled * bf
+            pending = dict(self.pending) if start < spilled_frames and end > disk_frames else {}
+            mem_start = max(start, spilled_frames) - spilled_frames
+            mem_end = max(end, spilled_frames) - spilled_frames
+            tail = self.block[mem_start:mem_end].copy()
+        
+        parts = []
+        if start < disk_frames:
+            disk_end = min(end, disk_frames)
+            parts.append(np.fromfile(self.path, dtype=np.float32, count=(disk_end - start) * self.channels,
+                offset=start * self.channels * 4).reshape(-1, self.channels))
+        pos = max(start, disk_frames)
+        while pos < min(end, spilled_frames):
+            index, offset = divmod(pos, bf)
+            piece = pending[index][offset:min(bf, end - index * bf)]
+            parts.append(piece)
+            pos += len(piece)
+        if not parts:
+            return tail
+        parts.append(tail)
+        return np.concatenate(parts)
+    
+    def close(self):
+        """残りのデータを書き出してファイルを閉じる"""
+        with self.lock:
+            if self.closed:
+                return
+            self.closed = True
+            if self.block_pos:
+                self.journal.put((None, self.block[:self.block_pos]))
+            self.journal.put(None)
+        self.writer.join()
+        self.file.close()
+    
+    def discard(self):
+        """セッションファイルを削除"""
+        self.close()
+        try:
+            os.remove(self.path)
+        except OSError:
+            pass
+
+class SPSCRing:
+    """単一プロデューサ・単一コンシューマのロックフリーなブロックキュー
+
+    事前に確保したスロットへブロックをコピーし、書き込みインデックス(head)は
+    キャプチャスレッドだけが、読み出しインデックス(tail)はコンシューマだけが
+    更新する（intの代入はアトミック）。満杯のときは待たずにブロックを捨てて
+    overruns を数えるので、キャプチャスレッドが読み手を待つことはない。
+    """
+    def __init__(self, slots, max_frames, channels):
+        self.slots = slots
+        self.max_frames = max_frames
+        self.data = np.zeros((slots, max_frames, channels), dtype=np.float32)
+        self.lengths = [0] * slots
+        self.positions = [None] * slots
+        self.head = 0
+        self.tail = 0
+        self.overruns = 0  # 満杯で捨てたブロック数
+        self.dropped_frames = 0
+    
+    def push(self, block, position=None):
+        """ブロックを追加（max_frames を超える場合は複数スロットに分割）"""
+        if block.ndim == 1:
+            block = block.reshape(-1, 1)
+        for offset in range(0, len(block), self.max_frames):
+            piece = block[offset:offset + self.max_frames]
+            if self.head - self.tail >= self.slots:
+                self.overruns += 1
+                self.dropped_frames += len(block) - offset
+                return False
+            slot = self.head % self.slots
+            self.data[slot, :len(piece)] = piece if piece.shape[1] == self.data.shape[2] else piece[:, :1]
+            self.lengths[slot] = len(piece)
+            self.positions[slot] = None if position is None else position + offset
+            self.head += 1  # スロットの内容を書き終えてから公開する
+        return True
+    
+    def peek(self):
+        """先頭のブロックを (データのビュー, 位置) で返す（空なら None）"""
+        if self.tail == self.head:
+            return None
+        slot = self.tail % self.slots
+        return self.data[slot, :self.lengths[slot]], self.positions[slot]
+    
+    def advance(self):
+        """peek したブロックの使用を終えてスロットを解放"""
+        self.tail += 1
+
+class CapturePump:
+    """キャプチャ用の SPSCRing から録音バッファへブロックを移すスレッド
+
+    録音バッファのロックや書き出し待ちの影響はこのスレッドが受け持つ。
+    listener(data, position) は書き込んだブロックごとに呼ばれる。
+    いずれかの録音バッファが limit_frames に達すると on_limit() を1回だけ呼ぶ。
+    """
+    def __init__(self, interval=0.01, limit_frames=None, on_limit=None):
+        self.routes = []
+        self.interval = interval
+        self.limit_frames = limit_frames
+        self.on_limit = on_limit
+        self.running = False
+        self.thread = None
+    
+    def add(self, ring, recorder, listener=None):
+        self.routes.append((ring, recorder, listener))
+    
+    def start(self):
+        self.running = True
+        self.thread = threading.Thread(target=self._run, daemon=True)
+        self.thread.start()
+        return self
+    
+    def _run(self):
+        while self.running:
+            if not self.drain():
+                time.sleep(self.interval)
+            if self.on_limit and any(len(recorder) >= self.limit_frames for _, recorder, _ in self.routes):
+                on_limit, self.on_limit = self.on_limit, None
+                on_limit()
+    
+    def drain(self):
+        """溜まっているブロックをすべて移し、移したブロック数を返す"""
+        moved = 0
+        for ring, recorder, listener in self.routes:
+            while True:
+                item = ring.peek()
+                if item is None:
+                    break
+                data, position = item
+                start = recorder.write(data, position)
+                if listener:
+                    listener(data, start)
+                ring.advance()
+                moved += 1
+        return moved
+    
+    def stop(self):
+        """スレッドを止めて残りのブロックを書き出す"""
+        self.running = False
+        if self.thread:
+            self.thread.join()
+        self.drain()
+
+class LevelMeter:
+    """キャプチャしたブロックのRMS/ピークを表示更新の間隔ごとにまとめて計算
+
+    ブロックを表示間隔の長さのフレームに区切り、フレームごとの二乗和と最大値を
+    一度に求める（コピーは作らない）。結果はUIチャネルへ (RMS, ピーク) の列として
+    送り、画面側が1更新ごとに1フレームずつ表示する。
+    """
+    def __init__(self, key, sample_rate):
+        self.key = key
+        self.frame_len = max(1, int(sample_rate / SETTINGS.ui.refresh_hz))
+    
+    def update(self, block):
+        if block.ndim == 1:
+            block = block.reshape(-1, 1)
+        n_frames = len(block) // self.frame_len
+        if n_frames == 0:
+            return
+        frames = block[:n_frames * self.frame_len].reshape(n_frames, -1)
+        rms = np.sqrt(np.einsum('ij,ij->i', frames, frames) / frames.shape[1])
+        peak = np.maximum(frames.max(axis=1), -frames.min(axis=1))
+        ui_channel.post_state(self.key, list(zip(rms.tolist(), peak.tolist())))
+
+class CaptureHub:
+    """録音バッファへ書き込んだブロックを複数の利用者へ分配するハブ
+
+    デバイスは録音スレッドが1回だけ開き、音声認識などはハブから読む。
+    subscribe() した読み手はそれぞれ独立したカーソルとバッファを持ち、
+    rate / channels を指定すると変換済みのストリーム（例: 16kHzモノラル）を受け取る。
+    add_listener() の関数はブロックごとにポンプのスレッドから直接呼ばれる。
+    """
+    def __init__(self, sample_rate, channels):
+        self.sample_rate = sample_rate
+        self.channels = channels
+        self.readers = []
+        self.listeners = []
+        self.lock = threading.Lock()
+    
+    def subscribe(self, rate=None, channels=None, max_seconds=None):
+        reader = HubReader(self, rate or self.sample_rate, channels or self.channels, max_seconds)
+        with self.lock:
+            self.readers.append(reader)
+        return reader
+    
+    def unsubscribe(self, reader):
         with self.lock:
-            if self.total_written < self.max_samples:
-                return self.buffer[:self.write_pos].copy()
-            return np.vstack((self.buffer[self.write_pos:], self.buffer[:self.write_pos])).copy()
+            if reader in self.readers:
+                self.readers.remove(reader)
+        reader.close()
+    
+    def add_listener(self, listener):
+        self.listeners.append(listener)
+    
+    def publish(self, data, position):
+        """CapturePump の listener として呼ばれる"""
+        for listener in self.listeners:
+            listener(data, position)
+        with self.lock:
+            readers = list(self.readers)
+        for reader in readers:
+            reader.feed(data, position)
+    
+    def close(self):
+        with self.lock:
+            readers, self.readers = self.readers, []
+        for reader in readers:
+            reader.close()
+
+class HubReader:
+    """CaptureHub の読み手1つ分（読み手が遅れたら古いサンプルから捨てる）"""
+    def __init__(self, hub, rate, channels, max_seconds=None):
+        self.rate = rate
+        self.src_rate = hub.sample_rate
+        self.channels = channels
+        self.resampler = StreamingResampler(hub.sample_rate, rate, channels) if rate != hub.sample_rate else None
+        max_seconds = max_seconds or SETTINGS.recording.hub_reader_seconds
+        self.max_frames = int(max_seconds * rate)
+        self.blocks = []
+        self.available = 0
+        self.position = None  # 次に読むサンプルの位置（読み手のレート）
+        self.dropped_frames = 0
+        self.closed = False
+        self.cond = threading.Condition()
+    
+    def feed(self, data, position):
+        if data.ndim == 1:
+            data = data.reshape(-1, 1)
+        if self.channels == 1 and data.shape[1] > 1:
+            data = data.mean(axis=1, keepdims=True, dtype=np.float32)
+        elif data.shape[1] != self.channels:
+            data = np.repeat(data[:, :1], self.channels, axis=1)
+        else:
+            # ポンプは SPSCRing のスロットをそのまま渡すのでコピーを持つ
+            data = data.copy()
+        if self.resampler:
+            data = self.resampler.process(data)
+        with self.cond:
+            if self.closed:
+                return
+            if self.position is None:
+                self.position = int(position * self.rate / self.src_rate)
+            self.blocks.append(data)
+            self.available += len(data)
+            # 上限を超えた分は古いブロックから捨てる
+            while self.available > self.max_frames and len(self.blocks) > 1:
+                dropped = self.blocks.pop(0)
+                self.available -= len(dropped)
+                self.dropped_frames += len(dropped)
+                self.position += len(dropped)
+            self.cond.notify_all()
+    
+    def read(self, frames, timeout=None):
+        """frames サンプルを読む（揃うまで待つ。閉じられたら残りだけ返す）"""
+        with self.cond:
+            if not self.cond.wait_for(lambda: self.available >= frames or self.closed, timeout):
+                return np.zeros((0, self.channels), dtype=np.float32)
+            parts = []
+            needed = min(frames, self.available)
+            while needed > 0:
+                block = self.blocks[0]
+                if len(block) <= needed:
+                    parts.append(self.blocks.pop(0))
+                else:
+                    parts.append(block[:needed])
+                    self.blocks[0] = block[needed:]
+                needed -= len(parts[-1])
+            count = sum(len(part) for part in parts)
+            self.available -= count
+            if self.position is not None:
+                self.position += count
+        if not parts:
+            return np.zeros((0, self.channels), dtype=np.float32)
+        return np.concatenate(parts)
+    
+    def close(self):
+        with self.cond:
+            self.closed = True
+            self.cond.notify_all()
+
+def hub_speech_source(reader, chunk=1024):
+    """HubReader を speech_recognition の AudioSource として使うアダプタ（16bit PCM）"""
+    class HubStream:
+        def read(self, size):
+            return to_pcm16(reader.read(size)[:, 0])
+    
+    class HubSource(sr.AudioSource):
+        SAMPLE_RATE = reader.rate
+        SAMPLE_WIDTH = 2
+        CHUNK = chunk
+        
+        def __init__(self):
+            self.stream = None
+        
+        def __enter__(self):
+            self.stream = HubStream()
+            return self
+        
+        def __exit__(self, *exc):
+            self.stream = None
+    
+    return HubSource()
+
+def make_capture_ring(channels):
+    """キャプチャ1系統分の SPSCRing を作成"""
+    max_frames = int(SETTINGS.recording.buffer_size * 1.1)
+    return SPSCRing(SETTINGS.recording.capture_queue_slots, max_frames, channels)
+
+def feed_system_vad(data, position):
+    """システム音声のハブへ届いたブロックを発話区間検出へ渡す"""
+    vad = system_vad
+    if vad:
+        vad.feed(data, position)
+
+SESSION_MANIFEST = "session.json"
+
+def write_session_manifest(session_dir, tracks, gain):
+    """録音中のセッション情報を保存（正常に保存できるまで残り、復元に使う）"""
+    data = {
+        "started": datetime.now().isoformat(timespec='seconds'),
+        "sample_rate": SETTINGS.recording.sample_rate,
+        "gain": gain,
+        "tracks": {name: {"file": os.path.basename(rec.path), "channels": rec.channels}
+                   for name, rec in tracks.items()},
+    }
+    with open(os.path.join(session_dir, SESSION_MANIFEST), 'w', encoding='utf-8') as f:
+        json.dump(data, f, indent=4, ensure_ascii=False)
+
+def remove_session_manifest(session_dir):
+    try:
+        os.remove(os.path.join(session_dir, SESSION_MANIFEST))
+    except OSError:
+        pass
+
+def find_unfinished_sessions():
+    """セッション情報が残っている（正常に保存されなかった）録音フォルダを返す"""
+    path = SETTINGS.paths.recordings
+    if not os.path.exists(path):
+        return []
+    return [os.path.join(path, d) for d in sorted(os.listdir(path))
+            if os.path.isfile(os.path.join(path, d, SESSION_MANIFEST))]
+
+def load_journal_track(session_dir, track):
+    """ジャーナルファイルを (サンプル数, チャンネル数) のメモリマップとして開く"""
+    path = os.path.join(session_dir, track["file"])
+    channels = track["channels"]
+    frames = os.path.getsize(path) // (4 * channels) if os.path.exists(path) else 0
+    if frames == 0:
+        return np.zeros((0, channels), dtype=np.float32)
+    return np.memmap(path, dtype=np.float32, mode='r', shape=(frames, channels))
+
+def recover_session(session_dir):
+    """ジャーナルからミックス済みの録音を作り直し、保存先のパスを返す
+
+    音声が1サンプルもなければ何も保存せずにジャーナルを削除して None を返す。
+    """
+    with open(os.path.join(session_dir, SESSION_MANIFEST), 'r', encoding='utf-8') as f:
+        manifest = json.load(f)
+    tracks = manifest["tracks"]
+    mic = load_journal_track(session_dir, tracks["mic"])
+    system = load_journal_track(session_dir, tracks["system"])
+    empty = len(mic) == 0 and len(system) == 0
+    path = save_mixed_recording(mic, system, manifest.get("gain", 1.0), os.path.join(session_dir, "output"))
+    del mic, system
+    if path or empty:
+        for track in tracks.values():
+            try:
+                os.remove(os.path.join(session_dir, track["file"]))
+            except OSError:
+                pass
+        remove_session_manifest(session_dir)
+    return path
+
+class VoiceActivityDetector:
+    """キャプチャスレッドから渡されるブロックで発話区間を判定するストリーミングVAD
+
+    ブロックごとにフレームエネルギー（平均絶対値）をまとめて計算し、発話の
+    開始/終了をサンプル位置付きのイベントとして events キューへ送る。
+    処理量は新しく入力されたサンプル数にのみ比例する。
+    """
+    def __init__(self, sample_rate, threshold=None, silence_duration=None, frame_ms=None,
+                 zcr_max=None, flatness_max=None):
+        self.sample_rate = sample_rate
+        self.threshold = SETTINGS.vad.threshold if threshold is None else threshold
+        self.frame_len = max(1, int(sample_rate * (frame_ms or SETTINGS.vad.frame_ms) / 1000))
+        silence = SETTINGS.vad.silence_duration if silence_duration is None else silence_duration
+        self.silence_frames = max(1, int(silence * sample_rate / self.frame_len))
+        self.zcr_max = SETTINGS.vad.zcr_max if zcr_max is None else zcr_max
+        self.flatness_max = SETTINGS.vad.flatness_max if flatness_max is None else flatness_max
+        self.events = queue.Queue()
+        self.pending = np.zeros(0, dtype=np.float32)
+        self.position = 0  # pending[0] のタイムライン位置
+        self.in_speech = False
+        self.silent_run = 0
+        self.speech_end = 0
+    
+    def feed(self, data, position=None):
+        """新しいサンプルを入力（position は data[0] のタイムライン位置）"""
+        if len(data) == 0:
+            return
+        mono = data.mean(axis=1, dtype=np.float32) if data.ndim == 2 else data
+        expected = self.position + len(self.pending)
+        if position is not None and position != expected:
+            if expected - len(mono) < position < expected:
+                # 処理済みの区間と重なる部分を捨てる
+                mono = mono[expected - position:]
+            else:
+                # 不連続（一時停止など）の場合は途中のフレームを破棄
+                self.pending = np.zeros(0, dtype=np.float32)
+                self.position = position
+        samples = np.concatenate((self.pending, mono)) if len(self.pending) else mono
+        n_frames = len(samples) // self.frame_len
+        used = n_frames * self.frame_len
+        if n_frames:
+            self._process(samples[:used].reshape(n_frames, self.frame_len))
+        self.pending = samples[used:].copy()
+        self.position += used
+    
+    def _process(self, frames):
+        voiced = np.abs(frames).mean(axis=1) >= self.threshold
+        if self.zcr_max is not None:
+            zcr = np.count_nonzero(np.diff(np.signbit(frames), axis=1), axis=1) / self.frame_len
+            voiced &= zcr <= self.zcr_max
+        if self.flatness_max is not None:
+            spectrum = np.abs(np.fft.rfft(frames, axis=1)) + 1e-10
+            flatness = np.exp(np.log(spectrum).mean(axis=1)) / spectrum.mean(axis=1)
+            voiced &= flatness <= self.flatness_max
+        
+        # 同じ判定が続く区間（ラン）単位で状態遷移を処理
+        edges = np.flatnonzero(np.diff(voiced.view(np.int8))) + 1
+        starts = np.concatenate(([0], edges))
+        ends = np.concatenate((edges, [len(voiced)]))
+        for start, end in zip(starts.tolist(), ends.tolist()):
+            frame_pos = self.position + start * self.frame_len
+            if voiced[start]:
+                if not self.in_speech:
+                    self.in_speech = True
+                    self.events.put(("speech_start", frame_pos))
+                self.silent_run = 0
+                self.speech_end = self.position + end * self.frame_len
+            elif self.in_speech:
+                self.silent_run += end - start
+                if self.silent_run >= self.silence_frames:
+                    self.in_speech = False
+                    self.events.put(("speech_end", self.speech_end))
+
+class StreamingResampler:
+    """ブロック単位の音声を状態を保ったまま任意の比率でリサンプリング
+
+    窓付きsincを phases 個の位相に分割したポリフェーズフィルタバンクを使い、
+    出力サンプルごとの入力位置と位相をまとめて計算する。step（出力1サンプル
+    あたりの入力サンプル数）はクロックのドリフト補正のため実行中に変更できる。
+    """
+    def __init__(self, src_rate, dst_rate, channels=1, half_taps=8, phases=128):
+        self.src_rate = src_rate
+        self.dst_rate = dst_rate
+        self.step = src_rate / dst_rate
+        self.channels = channels
+        self.phases = phases
+        # ダウンサンプル時は遮断周波数を下げ、その分タップ数を増やす
+        ratio = min(1.0, dst_rate / src_rate)
+        self.half = int(np.ceil(half_taps / ratio))
+        k = np.arange(-self.half + 1, self.half + 1)
+        frac = np.arange(phases) / phases
+        x = k[None, :] - frac[:, None]
+        cutoff = 0.95 * ratio
+        window = 0.5 + 0.5 * np.cos(np.pi * x / self.half)
+        bank = cutoff * np.sinc(cutoff * x) * window
+        self.bank = (bank / bank.sum(axis=1, keepdims=True)).astype(np.float32)
+        self.history = np.zeros((self.half - 1, channels), dtype=np.float32)
+        self.time = float(self.half - 1)  # 次の出力サンプルの history 上の位置
+    
+    def process(self, data):
+        """新しい入力ブロックを渡し、出力できる分のサンプルを返す"""
+        if data.ndim == 1:
+            data = data.reshape(-1, 1)
+        x = np.concatenate((self.history, data.astype(np.float32, copy=False)))
+        limit = len(x) - self.half  # floor(t) がこれ未満なら必要な入力が揃っている
+        count = max(0, int(np.ceil((limit - self.time) / self.step)))
+        positions = self.time + self.step * np.arange(count)
+        if count and positions[-1] >= limit:
+            count -= 1
+            positions = positions[:count]
+        index = positions.astype(np.int64)
+        phase = ((positions - index) * self.phases).astype(np.int64)
+        weights = self.bank[phase]
+        out = np.zeros((count, self.channels), dtype=np.float32)
+        for k in range(weights.shape[1]):
+            out += weights[:, k:k + 1] * x[index + (k - self.half + 1)]
+        
+        next_time = self.time + self.step * count
+        keep_from = int(next_time) - self.half + 1
+        self.history = x[keep_from:].copy()
+        self.time = next_time - keep_from
+        return out
+    
+    def flush(self):
+        """残りの入力を出し切る（ファイル全体の一括変換用）"""
+        return self.process(np.zeros((self.half, self.channels), dtype=np.float32))
+
+class ClockDriftEstimator:
+    """受け取ったサンプル数と単調時計から、デバイスの実際のサンプルレートを推定
+
+    デバイスのクロックとPCのクロックのずれ（数百ppm程度）を、直近 window 秒の
+    (キャプチャ時刻, 累積サンプル数) の回帰直線の傾きで求める。配信が途切れた
+    区間（無音時のWASAPIループバックやスレッドの停止）は計測に含めず、そこから
+    計測をやり直す。
+    """
+    def __init__(self, nominal_rate, warmup=None, max_ppm=None, window=None):
+        self.nominal_rate = nominal_rate
+        self.warmup = SETTINGS.recording.drift_warmup_seconds if warmup is None else warmup
+        self.max_ppm = SETTINGS.recording.drift_max_ppm if max_ppm is None else max_ppm
+        self.window = SETTINGS.recording.drift_window_seconds if window is None else window
+        self.times = deque()
+        self.counts = deque()
+        self.frames = 0  # 計測中の区間で受け取ったサンプル数
+        self.last_frames = 0
+        self.rate = float(nominal_rate)
+    
+    def update(self, frames, timestamp=None):
+        """ブロック受信ごとに呼び（timestamp はブロック先頭の時刻）、推定した実サンプルレートを返す"""
+        now = time.monotonic() if timestamp is None else timestamp
+        if self.times and now - self.times[-1] > 2 * self.last_frames / self.nominal_rate:
+            # 1ブロック分を超えて何も届かなかった: 途切れをまたいで計測しない
+            self.times.clear()
+            self.counts.clear()
+            self.frames = 0
+        self.times.append(now)
+        self.counts.append(self.frames)
+        self.frames += frames
+        self.last_frames = frames
+        while now - self.times[0] > self.window:
+            self.times.popleft()
+            self.counts.popleft()
+        if now - self.times[0] >= min(self.warmup, self.window) and len(self.times) >= 3:
+            t = np.asarray(self.times) - self.times[0]
+            n = np.asarray(self.counts, dtype=np.float64)
+            measured = np.polyfit(t, n, 1)[0]
+            limit = self.nominal_rate * self.max_ppm / 1e6
+            self.rate = float(np.clip(measured, self.nominal_rate - limit, self.nominal_rate + limit))
+        return self.rate
+
+class SourceConverter:
+    """キャプチャ元のブロックを録音サンプルレートの共通タイムラインへ変換
+
+    公称レートの違い（例: 48000Hz → 44100Hz）とクロックのドリフトをまとめて補正する。
+    """
+    def __init__(self, src_rate, channels, dst_rate=None):
+        dst_rate = dst_rate or SETTINGS.recording.sample_rate
+        self.resampler = StreamingResampler(src_rate, dst_rate, channels)
+        self.drift = ClockDriftEstimator(src_rate)
+        self.dst_rate = dst_rate
+    
+    def process(self, data, timestamp=None):
+        rate = self.drift.update(len(data), timestamp)
+        self.resampler.step = rate / self.dst_rate
+        return self.resampler.process(data)
+
+def resample_audio(data, src_rate, dst_rate):
+    """モノラル音声を一括でリサンプリング"""
+    if src_rate == dst_rate or len(data) == 0:
+        return data.astype(np.float32, copy=False)
+    resampler = StreamingResampler(src_rate, dst_rate, 1)
+    n_out = int(len(data) * dst_rate / src_rate)
+    out = np.concatenate((resampler.process(data), resampler.flush()))
+    return out[:n_out, 0]
+
+CHUNK_FORMATS = {
+    # 形式名: (soundfileのformat, subtype, MIMEタイプ)
+    "wav16k": ("WAV", "PCM_16", "audio/wav"),
+    "flac": ("FLAC", "PCM_16", "audio/flac"),
+    "opus": ("OGG", "OPUS", "audio/ogg"),
+}
+
+def encode_audio_chunk(data, sample_rate, fmt=None):
+    """音声チャンクを16kHzモノラルに変換し、メモリ上でエンコードして (bytes, MIMEタイプ) を返す"""
+    fmt = fmt or SETTINGS.transcription.chunk_format
+    if fmt not in CHUNK_FORMATS:
+        fmt = "wav16k"
+    file_format, subtype, mime_type = CHUNK_FORMATS[fmt]
+    if data.ndim == 2:
+        data = data.mean(axis=1, dtype=np.float32)
+    target_rate = SETTINGS.transcription.sample_rate
+    mono = resample_audio(data, sample_rate, target_rate)
+    buf = io.BytesIO()
+    sf.write(buf, mono, target_rate, format=file_format, subtype=subtype)
+    return buf.getvalue(), mime_type
+
+class TranscriptionPool:
+    """音声セグメントを並列に文字起こしし、結果を元の時系列順に届けるワーカープール
+
+    submit() は処理中・順番待ちのセグメントが max_pending に達するとブロックする
+    （バックプレッシャー）。transcribe(segment) はテキストを返す関数、
+    on_result(segment, text) は submit した順に呼ばれる。on_done(segment) は
+    テキストが空の場合も含め、順番が来たセグメントごとに呼ばれる（進捗表示用）。
+    """
+    def __init__(self, transcribe, on_result, workers=None, max_pending=None, on_done=None):
+        self.transcribe = transcribe
+        self.on_result = on_result
+        self.on_done = on_done
+        workers = workers or SETTINGS.transcription.workers
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="transcribe")
+        self.slots = threading.BoundedSemaphore(max(workers, max_pending or SETTINGS.transcription.max_pending))
+        self.lock = threading.Lock()
+        self.next_seq = 0
+        self.next_deliver = 0
+        self.finished = {}
+    
+    def submit(self, segment, timeout=None):
+        """セグメントを投入（timeout 内に空きができなければ False）"""
+        if not self.slots.acquire(timeout=timeout):
+            return False
+        with self.lock:
+            seq = self.next_seq
+            self.next_seq += 1
+        self.executor.submit(self._run, seq, segment)
+        return True
+    
+    def _run(self, seq, segment):
+        try:
+            text = self.transcribe(segment)
+        except Exception as e:
+            print(f"Transcription error: {e}")
+            text = ""
+        with self.lock:
+            self.finished[seq] = (segment, text)
+            # 先頭から連続して完了している結果だけを順番に届ける
+            while self.next_deliver in self.finished:
+                done_segment, done_text = self.finished.pop(self.next_deliver)
+                self.next_deliver += 1
+                self.slots.release()
+                try:
+                    if done_text:
+                        self.on_result(done_segment, done_text)
+                    if self.on_done:
+                        self.on_done(done_segment)
+                except Exception as e:
+                    print(f"Transcription callback error: {e}")
+    
+    @property
+    def pending(self):
+        """処理中・順番待ちのセグメント数"""
+        with self.lock:
+            return self.next_seq - self.next_deliver
+    
+    def shutdown(self, wait=False):
+        self.executor.shutdown(wait=wait)
+
+class ChunkScheduler:
+    """システム音声を何秒ごとに区切って文字起こしへ送るかを決める
+
+    発話の先頭が表示されるまでの時間（チャンク長 + 応答時間）が目標に収まるよう、
+    リクエストごとの応答時間を「固定分 + 音声1秒あたり」の線形モデルで推定して
+    チャンク長を決める。プールが詰まっているときは短い発話をまとめて送る回数を
+    減らす。送ったチャンクの長さ・応答時間・トークン数は log_path に JSON Lines で残す。
+    """
+    def __init__(self, workers=None, log_path=None, target=None, min_seconds=None, max_seconds=None, decay=0.9):
+        self.workers = workers or SETTINGS.transcription.workers
+        self.target = target or SETTINGS.transcription.target_latency_seconds
+        self.min_seconds = min_seconds or SETTINGS.transcription.min_chunk_seconds
+        self.max_seconds = max_seconds or SETTINGS.transcription.max_chunk_seconds
+        self.decay = decay
+        self.log_path = log_path
+        self.lock = threading.Lock()
+        # 指数的に重み付けした回帰用の和（x=チャンク秒数, y=応答秒数）
+        self.sw = self.sx = self.sy = self.sxx = self.sxy = 0.0
+    
+    def predict_latency(self, seconds):
+        """seconds 秒のチャンクの応答時間の推定（計測前は 0）"""
+        with self.lock:
+            if self.sw == 0:
+                return 0.0
+            mean_x, mean_y = self.sx / self.sw, self.sy / self.sw
+            var = self.sxx / self.sw - mean_x ** 2
+            slope = (self.sxy / self.sw - mean_x * mean_y) / var if var > 1e-6 else 0.0
+            slope = max(0.0, slope)
+            return max(0.0, mean_y + slope * (seconds - mean_x))
+    
+    def chunk_seconds(self, pending=0):
+        """次のチャンクの目標の長さ（秒）"""
+        base = self.predict_latency(0)
+        per_second = self.predict_latency(1) - base
+        # chunk + base + per_second * chunk = target
+        seconds = (self.target - base) / (1 + per_second)
+        # 処理待ちが溜まっていたら長めにまとめてリクエスト数を減らす
+        if pending >= self.workers:
+            seconds *= 1 + (pending - self.workers + 1) / self.workers
+        return float(np.clip(seconds, self.min_seconds, self.max_seconds))
+    
+    def record(self, seconds, latency, tokens=None, pending=0, size=None):
+        """完了したリクエストの計測値を反映してログに残す"""
+        with self.lock:
+            d = self.decay
+            self.sw = self.sw * d + 1
+            self.sx = self.sx * d + seconds
+            self.sy = self.sy * d + latency
+            self.sxx = self.sxx * d + seconds * seconds
+            self.sxy = self.sxy * d + seconds * latency
+        if self.log_path:
+            entry = {"time": round(time.time(), 3), "chunk_seconds": round(seconds, 2), "latency": round(latency, 3),
+                "tokens": tokens, "bytes": size, "pending": pending, "next_chunk_seconds": round(self.chunk_seconds(pending), 2)}
+            try:
+                with open(self.log_path, 'a', encoding='utf-8') as f:
+                    f.write(json.dumps(entry) + "\n")
+            except OSError as e:
+                print(f"Chunk log error: {e}")
+
+def to_pcm16(data):
+    """float32 のモノラル音声を 16bit PCM のバイト列に変換"""
+    if data.ndim == 2:
+        data = data.mean(axis=1, dtype=np.float32)
+    return (np.clip(data, -1.0, 1.0) * 32767).astype('<i2').tobytes()
+
+class TranscriptionEngine:
+    """文字起こしエンジンの共通インターフェース
+
+    transcribe(audio, sample_rate, stats) は区切られた音声1区間をテキストにする
+    （stats の dict には分かる範囲で使用トークン数などを入れる）。
+    streaming が True のエンジンは open_stream() で 16kHz モノラルの小さな
+    フレームを逐次渡し、途中結果（partial）と確定結果（final）を受け取れる。
+    """
+    name = ""
+    streaming = False
+    
+    def available(self):
+        """使えない場合は理由を返す（使えるなら None）"""
+        return None
+    
+    def transcribe(self, audio, sample_rate, stats=None):
+        raise NotImplementedError
+    
+    def open_stream(self, sample_rate):
+        raise NotImplementedError
+
+class GoogleSpeechEngine(TranscriptionEngine):
+    """speech_recognition 経由の Google 音声認識（オンライン）"""
+    name = "google"
+    
+    def available(self):
+        return None if SPEECH_RECOGNITION_AVAILABLE else "SpeechRecognition not available"
+    
+    def transcribe(self, audio, sample_rate, stats=None):
+        target_rate = SETTINGS.transcription.sample_rate
+        if audio.ndim == 2:
+            audio = audio.mean(axis=1, dtype=np.float32)
+        audio_data = sr.AudioData(to_pcm16(resample_audio(audio, sample_rate, target_rate)), target_rate, 2)
+        try:
+            return sr.Recognizer().recognize_google(audio_data, language="ja-JP")
+        except sr.UnknownValueError:
+            return ""  # 無音または認識不可
+
+class GeminiEngine(TranscriptionEngine):
+    """Gemini に音声チャンクを送って文字起こし（オンライン）"""
+    name = "gemini"
+    
+    def available(self):
+        return None if gemini_assistant.is_configured else "Gemini not configured"
+    
+    def transcribe(self, audio, sample_rate, stats=None):
+        # メモリ上でエンコード（一時ファイルは使わない）
+        audio_bytes, mime_type = encode_audio_chunk(audio, sample_rate)
+        if stats is not None:
+            stats["bytes"] = len(audio_bytes)
+        return gemini_assistant.transcribe_chunk(audio_bytes, mime_type, stats)
+
+class VoskEngine(TranscriptionEngine):
+    """Vosk によるローカル（CPU）の音声認識。モデルは1回だけ読み込んで使い回す"""
+    name = "vosk"
+    streaming = True
+    
+    def __init__(self, model_path=None):
+        self.model_path = model_path or SETTINGS.transcription.vosk_model_path
+        self.model = None
+        self.lock = threading.Lock()
+    
+    def available(self):
+        if not VOSK_AVAILABLE:
+            return "vosk not available"
+        if not os.path.isdir(self.model_path):
+            return f"Vosk model not found: {self.model_path}"
+        return None
+    
+    def load(self):
+        with self.lock:
+            if self.model is None:
+                vosk.SetLogLevel(-1)
+                self.model = vosk.Model(self.model_path)
+        return self.model
+    
+    def transcribe(self, audio, sample_rate, stats=None):
+        target_rate = SETTINGS.transcription.sample_rate
+        if audio.ndim == 2:
+            audio = audio.mean(axis=1, dtype=np.float32)
+        stream = self.open_stream(target_rate)
+        finals, _ = stream.feed(resample_audio(audio, sample_rate, target_rate))
+        return " ".join(finals + [stream.flush()]).strip()
+    
+    def open_stream(self, sample_rate):
+        return VoskStream(vosk.KaldiRecognizer(self.load(), sample_rate))
+
+class VoskStream:
+    """VoskEngine の逐次認識1本分"""
+    def __init__(self, recognizer):
+        self.recognizer = recognizer
+    
+    def feed(self, frames):
+        """フレームを渡し (確定したテキストのリスト, 途中結果) を返す"""
+        if self.recognizer.AcceptWaveform(to_pcm16(frames)):
+            text = self._text(self.recognizer.Result(), "text")
+            return ([text] if text else []), ""
+        return [], self._text(self.recognizer.PartialResult(), "partial")
+    
+    def flush(self):
+        return self._text(self.recognizer.FinalResult(), "text")
+    
+    @staticmethod
+    def _text(result, key):
+        # 日本語モデルは単語ごとに空白を入れて返す
+        return json.loads(result).get(key, "").replace(" ", "")
+
+TRANSCRIPTION_ENGINES = {"google": GoogleSpeechEngine, "gemini": GeminiEngine, "vosk": VoskEngine}
+_engine_instances = {}
+
+def get_transcription_engine(name, fallback):
+    """設定名のエンジンを返す（使えなければ fallback のエンジン）。インスタンスは使い回す"""
+    for key in (name, fallback):
+        if key not in TRANSCRIPTION_ENGINES:
+            continue
+        if key not in _engine_instances:
+            _engine_instances[key] = TRANSCRIPTION_ENGINES[key]()
+        engine = _engine_instances[key]
+        reason = engine.available()
+        if reason is None:
+            return engine
+        print(f"Transcription engine '{key}' unavailable: {reason}")
+    return None
+
+def iter_decoded_audio(path, sample_rate, block_seconds=10):
+    """音声ファイルをモノラル float32 のブロックに順次デコード（ファイル全体は読み込まない）
+
+    soundfile で読めない形式（m4a など）は ffmpeg のパイプ出力から読む。
+    """
+    block_frames = int(block_seconds * sample_rate)
+    try:
+        f = sf.SoundFile(path)
+    except Exception:
+        f = None
+    if f is not None:
+        with f:
+            resampler = StreamingResampler(f.samplerate, sample_rate, 1) if f.samplerate != sample_rate else None
+            for block in f.blocks(blocksize=int(block_seconds * f.samplerate), dtype='float32', always_2d=True):
+                mono = block.mean(axis=1, dtype=np.float32)
+                yield resampler.process(mono)[:, 0] if resampler else mono
+            if resampler:
+                yield resampler.flush()[:, 0]
+        return
+    
+    ffmpeg = find_ffmpeg()
+    if not ffmpeg:
+        raise RuntimeError("この形式の読み込みにはFFmpegが必要です")
+    proc = subprocess.Popen([ffmpeg, "-v", "error", "-i", path, "-f", "f32le", "-ac", "1", "-ar", str(sample_rate), "-"],
+        stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, startupinfo=hidden_startupinfo())
+    try:
+        while True:
+            data = proc.stdout.read(block_frames * 4)
+            if not data:
+                break
+            yield np.frombuffer(data[:len(data) // 4 * 4], dtype=np.float32)
+    finally:
+        proc.stdout.close()
+        proc.wait()
+
+def quietest_point(audio, start, end, sample_rate, frame_seconds=0.25):
+    """audio[start:end] の中で最も静かなフレームの中央位置"""
+    frame = max(1, int(frame_seconds * sample_rate))
+    region = audio[start:end]
+    n_frames = len(region) // frame
+    if n_frames == 0:
+        return end
+    frames = region[:n_frames * frame].reshape(n_frames, frame)
+    energy = np.einsum('ij,ij->i', frames, frames)
+    return start + int(np.argmin(energy)) * frame + frame // 2
+
+def iter_audio_windows(blocks, sample_rate, window_seconds=None, overlap_seconds=None, search_seconds=None):
+    """デコード済みブロックを無音の位置で区切り、重なりを持たせた (開始サンプル, 音声) を順に返す
+
+    保持するのは区切り待ちの1区間分だけなので、入力の長さに関係なくメモリは一定。
+    """
+    window = int((window_seconds or SETTINGS.transcription.file_window_seconds) * sample_rate)
+    overlap = int((overlap_seconds if overlap_seconds is not None else SETTINGS.transcription.file_overlap_seconds) * sample_rate)
+    search = min(window // 2, int((search_seconds or SETTINGS.transcription.file_search_seconds) * sample_rate))
+    parts, buffered, start = [], 0, 0
+    for block in blocks:
+        parts.append(block)
+        buffered += len(block)
+        while buffered >= window:
+            audio = np.concatenate(parts)
+            cut = quietest_point(audio, window - search, window, sample_rate)
+            yield start, audio[:cut]
+            keep_from = max(cut - overlap, 1)
+            parts = [audio[keep_from:]]
+            buffered = len(parts[0])
+            start += keep_from
+    # 最後の区間（前の区間との重なりしか残っていなければ不要）
+    if buffered > (overlap if start else 0):
+        yield start, np.concatenate(parts)
+
+def stitch_transcripts(pieces, max_overlap_chars=300, min_match_chars=8):
+    """区間ごとの文字起こしを、重なり部分の重複を取り除きながら [時刻] 付きでつなぐ
+
+    pieces は (開始秒, テキスト) の時系列順のリスト。
+    """
+    lines = []
+    prev = ""
+    for start_seconds, text in pieces:
+        text = text.strip()
+        if prev and text:
+            tail, head = prev[-max_overlap_chars:], text[:max_overlap_chars]
+            match = difflib.SequenceMatcher(None, tail, head, autojunk=False).find_longest_match(0, len(tail), 0, len(head))
+            if match.size >= min_match_chars:
+                text = text[match.b + match.size:].lstrip()
+        if text:
+            lines.append(f"[{convert_seconds(start_seconds)}]\n{text}")
+            prev = text
+    return "\n\n".join(lines)
 
 def find_ffmpeg():
     exe = "ffmpeg.exe" if os.name == "nt" else "ffmpeg"
@@ -417,64 +1883,231 @@ def find_ffmpeg():
                 return p
     return shutil.which(exe)
 
+class DeviceRegistry:
+    """音声デバイスの一覧をバックエンドごとに1回だけ列挙して保持するレジストリ
+
+    soundcard のマイク/ループバックと PortAudio（WASAPIループバック録音で使う
+    デバイス番号）を id・名前・ホストAPIで引けるようにする。バックグラウンドで
+    soundcard の一覧を定期的に確認し、変化したときだけ PortAudio 側も列挙し直す。
+    録音中は WASAPI ストリームと競合しないよう PortAudio の列挙を停止後まで延ばす。
+    """
+    def __init__(self, poll_seconds=None):
+        self.poll_seconds = poll_seconds or SETTINGS.devices.poll_seconds
+        self.lock = threading.Lock()
+        self.soundcard = []  # SimpleNamespace(id, name, loopback, device)
+        self.portaudio = []  # SimpleNamespace(index, name, host_api, loopback, info)
+        self.wasapi_default_output = None  # WASAPIの既定出力デバイス番号
+        self.portaudio_stale = False  # 録音中に変化があり PortAudio を列挙し直す必要がある
+        self.listeners = []
+        self.loaded = threading.Event()
+        self.running = False
+        self.thread = None
+    
+    def add_listener(self, callback):
+        """一覧が変わるたびに callback() を（ワーカースレッドから）呼ぶ"""
+        self.listeners.append(callback)
+        if self.loaded.is_set():
+            callback()
+    
+    def start(self):
+        if self.running:
+            return
+        self.running = True
+        self.thread = threading.Thread(target=self._poll, daemon=True)
+        self.thread.start()
+    
+    def stop(self):
+        self.running = False
+    
+    def _poll(self):
+        self.refresh(force=True)
+        while self.running:
+            time.sleep(self.poll_seconds)
+            if self.running:
+                self.refresh(force=self.portaudio_stale and not recording)
+    
+    def refresh(self, force=False):
+        """一覧を取り直す。変化がなければ何もしない（変化したら True）"""
+        soundcard = self._enumerate_soundcard()
+        key = [(d.id, d.name, d.loopback) for d in soundcard]
+        with self.lock:
+            changed = force or key != [(d.id, d.name, d.loopback) for d in self.soundcard]
+        if not changed:
+            return False
+        # PortAudio の列挙は重いので soundcard 側に変化があったときだけ。録音中は
+        # PortAudio がスレッドセーフでないため2つ目の PyAudio を作らず、停止後に行う
+        portaudio = None
+        if recording:
+            self.portaudio_stale = True
+        else:
+            portaudio, default_output = self._enumerate_portaudio()
+            self.portaudio_stale = False
+        with self.lock:
+            self.soundcard = soundcard
+            if portaudio is not None:
+                self.portaudio = portaudio
+                self.wasapi_default_output = default_output
+        self.loaded.set()
+        for callback in list(self.listeners):
+            try:
+                callback()
+            except Exception as e:
+                print(f"Device listener error: {e}")
+        return True
+    
+    def _enumerate_soundcard(self):
+        try:
+            return [SimpleNamespace(id=m.id, name=m.name, loopback=bool(m.isloopback), device=m)
+                    for m in sc.all_microphones(include_loopback=True)]
+        except Exception as e:
+            print(f"Device enumeration error: {e}")
+            return []
+    
+    def _enumerate_portaudio(self):
+        if not WASAPI_AVAILABLE:
+            return [], None
+        devices, default_output = [], None
+        try:
+            # PortAudio は初期化時点の一覧しか返さないので毎回作り直す
+            p = pyaudio.PyAudio()
+            try:
+                host_apis = {i: p.get_host_api_info_by_index(i)["name"] for i in range(p.get_host_api_count())}
+                for i in range(p.get_device_count()):
+                    info = p.get_device_info_by_index(i)
+                    devices.append(SimpleNamespace(
+                        index=i, name=info["name"], host_api=host_apis.get(info["hostApi"], ""),
+                        loopback=bool(info.get("isLoopbackDevice", False)), info=info))
+                default_output = p.get_host_api_info_by_type(pyaudio.paWASAPI)["defaultOutputDevice"]
+            finally:
+                p.terminate()
+        except Exception as e:
+            print(f"PortAudio enumeration error: {e}")
+        return devices, default_output
+    
+    def microphones(self, loopback=False):
+        with self.lock:
+            return [d for d in self.soundcard if d.loopback == loopback]
+    
+    def get_microphone(self, device_id, loopback=False):
+        """soundcard のマイクを id で取得（一覧になければ soundcard に問い合わせる）"""
+        with self.lock:
+            for d in self.soundcard:
+                if d.id == device_id and d.loopback == loopback:
+                    return d.device
+        return sc.get_microphone(id=device_id, include_loopback=loopback)
+    
+    def soundcard_name(self, device_id):
+        with self.lock:
+            for d in self.soundcard:
+                if d.id == device_id:
+                    return d.name
+        return None
+    
+    def wasapi_loopback(self, name=None):
+        """指定名（なければ既定スピーカー）に対応する WASAPI ループバックの情報"""
+        with self.lock:
+            loopbacks = [d for d in self.portaudio if d.loopback]
+            default = next((d for d in self.portaudio if d.index == self.wasapi_default_output), None)
+        targets = [target for target in (name, default.name if default else None) if target]
+        # 完全な名前で一致するものを優先し、なければ「スピーカー」などの先頭部分で探す
+        for target in targets:
+            for d in loopbacks:
+                if d.name.startswith(target):
+                    return d.info
+        for target in targets:
+            base = target.split(" (")[0]
+            for d in loopbacks:
+                if d.name.startswith(base):
+                    return d.info
+        if loopbacks:
+            return loopbacks[0].info
+        return default.info if default else None
+
+device_registry = DeviceRegistry()
+
+class SourceTimeline:
+    """キャプチャ1系統のブロックをタイムライン上に並べる位置を決める
+
+    位置は最初のブロック（と再開直後）だけ時計から決め、以降は届いたサンプル数で
+    進める。読み出し時刻の揺らぎ（スレッドのスケジューリングや Windows の時計の
+    粗さ）はブロックごとには反映せず、平滑化したずれが許容範囲を超えたときだけ
+    補正する。1ブロック分を超える食い違いは配信の途切れとみなして位置を取り直す。
+    """
+    def __init__(self, clock, gap_frames=None, smoothing=None):
+        self.clock = clock
+        self.gap_frames = gap_frames or SETTINGS.recording.buffer_size
+        self.smoothing = smoothing or SETTINGS.recording.sync_smoothing
+        self.tolerance = clock.sample_rate * SETTINGS.recording.sync_tolerance_ms / 1000
+        self.next = None  # 次のブロックを置く位置
+        self.offset = 0.0  # 時計との平滑化したずれ（サンプル）
+    
+    def place(self, frames, timestamp):
+        """frames サンプルのブロックを置く位置を返す（timestamp はブロック先頭のキャプチャ時刻）"""
+        measured = self.clock.position(timestamp)
+        if self.next is None or abs(measured - self.next) > self.gap_frames:
+            self.next = measured
+            self.offset = 0.0
+        else:
+            self.offset += self.smoothing * ((measured - self.next) - self.offset)
+            if abs(self.offset) > self.tolerance:
+                self.next += int(round(self.offset))
+                self.offset = 0.0
+        position = self.next
+        self.next += frames
+        return position
+    
+    def reset(self):
+        """一時停止中に呼ぶ（再開後の最初のブロックで位置を取り直す）"""
+        self.next = None
+
 def record_from_mic(frame):
-    global mic_buffer, input_source_id, pause, recording, recording_start_time
+    global mic_queue, session_clock, input_source_id, pause, recording
     try:
-        with sc.get_microphone(id=input_source_id, include_loopback=False).recorder(
+        with device_registry.get_microphone(input_source_id).recorder(
             samplerate=SETTINGS.recording.sample_rate, blocksize=SETTINGS.recording.buffer_size
         ) as mic:
+            converter = None
+            meter = LevelMeter("level_mic", SETTINGS.recording.sample_rate)
+            timeline = SourceTimeline(session_clock)
             while recording:
                 data = mic.record(numframes=SETTINGS.recording.buffer_size)
+                # ブロック先頭サンプルのキャプチャ時刻
+                captured = time.monotonic() - len(data) / SETTINGS.recording.sample_rate
+                if converter is None:
+                    converter = SourceConverter(SETTINGS.recording.sample_rate, data.shape[1])
+                # 一時停止中もクロック計測を続けるため変換は常に行う
+                data = converter.process(data, captured)
+                meter.update(data)
                 if not pause:
-                    mic_buffer.write(data)
-                    if recording_start_time:
-                        elapsed = time.time() - recording_start_time
-                        icon = "● " if int(elapsed * 2) % 2 == 0 else "○ "
-                        try:
-                            frame.label_time.configure(text=icon + convert_seconds(elapsed), text_color=THEME.colors.danger)
-                        except: pass
+                    position = timeline.place(len(data), captured)
+                    mic_queue.push(data, position)
                 else:
-                    try:
-                        frame.label_time.configure(text=t("paused"), text_color=THEME.colors.warning)
-                    except: pass
+                    timeline.reset()
+                    position = session_clock.position(captured)
+                # 表示はUIチャネルへ状態を渡すだけ（Tkには触れない）
+                ui_channel.post_state("recording_clock", (position + len(data), pause))
     except Exception as e:
         print(f"Mic error: {e}")
-    try:
-        frame.label_time.configure(text="00:00:00", text_color=THEME.colors.text)
-    except: pass
 
 def record_system_audio_wasapi(frame):
     """WASAPIループバックでシステム音声を録音（音が消えない）"""
-    global system_buffer, pause, recording, wasapi_device_index
+    global system_queue, session_clock, system_source_id, pause, recording
     
-    if pyaudio is None or not WASAPI_AVAILABLE:
+    if not WASAPI_AVAILABLE:
         print("WASAPI not available, falling back to soundcard")
         record_system_audio_soundcard(frame)
         return
     
     try:
-        p = pyaudio.PyAudio()
-        
-        # WASAPIループバックデバイスを探す
-        wasapi_info = p.get_host_api_info_by_type(pyaudio.paWASAPI)
-        default_speakers = p.get_device_info_by_index(wasapi_info["defaultOutputDevice"])
-        
-        # ループバックデバイスを検索
-        loopback_device = None
-        for i in range(p.get_device_count()):
-            dev = p.get_device_info_by_index(i)
-            if dev.get("isLoopbackDevice", False):
-                # 指定デバイスまたはデフォルトスピーカーのループバック
-                if wasapi_device_index is None or dev["name"].startswith(default_speakers["name"].split(" (")[0]):
-                    loopback_device = dev
-                    break
-        
+        # WASAPIループバックデバイスはレジストリから選ぶ（選択中のシステム音声と同じ出力先を優先）
+        device_registry.loaded.wait(timeout=5)
+        loopback_device = device_registry.wasapi_loopback(device_registry.soundcard_name(system_source_id))
         if loopback_device is None:
-            print("No loopback device found, using default")
-            loopback_device = default_speakers
+            raise RuntimeError("No WASAPI loopback device found")
         
         print(f"Using WASAPI loopback: {loopback_device['name']}")
         
+        p = pyaudio.PyAudio()
         channels = int(loopback_device["maxInputChannels"])
         rate = int(loopback_device["defaultSampleRate"])
         
@@ -487,17 +2120,24 @@ def record_system_audio_wasapi(frame):
             frames_per_buffer=SETTINGS.recording.buffer_size
         )
         
+        # デバイスのレート（48000Hz等）から録音レートへ変換
+        converter = SourceConverter(rate, min(channels, 2))
+        meter = LevelMeter("level_system", SETTINGS.recording.sample_rate)
+        timeline = SourceTimeline(session_clock)
+        
         while recording:
             try:
                 data = stream.read(SETTINGS.recording.buffer_size, exception_on_overflow=False)
+                captured = time.monotonic() - SETTINGS.recording.buffer_size / rate
+                audio_data = converter.process(np.frombuffer(data, dtype=np.float32).reshape(-1, channels)[:, :2], captured)
+                meter.update(audio_data)
                 if not pause:
-                    audio_data = np.frombuffer(data, dtype=np.float32)
                     # ステレオに変換
                     if channels == 1:
-                        audio_data = np.column_stack((audio_data, audio_data))
-                    else:
-                        audio_data = audio_data.reshape(-1, channels)[:, :2]
-                    system_buffer.write(audio_data)
+                        audio_data = np.column_stack((audio_data[:, 0], audio_data[:, 0]))
+                    system_queue.push(audio_data, timeline.place(len(audio_data), captured))
+                else:
+                    timeline.reset()
             except Exception as e:
                 print(f"Stream read error: {e}")
         
@@ -512,15 +2152,25 @@ def record_system_audio_wasapi(frame):
 
 def record_system_audio_soundcard(frame):
     """soundcardでシステム音声を録音（フォールバック）"""
-    global system_buffer, system_source_id, pause, recording
+    global system_queue, session_clock, system_source_id, pause, recording
     try:
-        with sc.get_microphone(id=system_source_id, include_loopback=True).recorder(
+        with device_registry.get_microphone(system_source_id, loopback=True).recorder(
             samplerate=SETTINGS.recording.sample_rate, blocksize=SETTINGS.recording.buffer_size
         ) as rec:
+            converter = None
+            meter = LevelMeter("level_system", SETTINGS.recording.sample_rate)
+            timeline = SourceTimeline(session_clock)
             while recording:
                 data = rec.record(numframes=SETTINGS.recording.buffer_size)
+                captured = time.monotonic() - len(data) / SETTINGS.recording.sample_rate
+                if converter is None:
+                    converter = SourceConverter(SETTINGS.recording.sample_rate, data.shape[1])
+                data = converter.process(data, captured)
+                meter.update(data)
                 if not pause:
-                    system_buffer.write(data)
+                    system_queue.push(data, timeline.place(len(data), captured))
+                else:
+                    timeline.reset()
     except Exception as e:
         print(f"System audio error: {e}")
 
@@ -531,36 +2181,278 @@ def record_system_audio(frame):
     else:
         record_system_audio_soundcard(frame)
 
-def mix_audio(mic_audio, system_audio):
-    if mic_audio is None and system_audio is None:
-        return np.array([])
-    if mic_audio is None:
-        return system_audio
-    if system_audio is None:
-        return mic_audio
-    
-    if len(mic_audio.shape) == 1:
-        mic_audio = np.column_stack((mic_audio, mic_audio))
-    elif mic_audio.shape[1] == 1:
-        mic_audio = np.column_stack((mic_audio.flatten(), mic_audio.flatten()))
-    
-    delay = int(SETTINGS.recording.sample_rate * abs(SETTINGS.recording.mic_delay_ms) / 1000)
-    if SETTINGS.recording.mic_delay_ms < 0:
-        mic_audio = np.vstack((np.zeros((delay, 2)), mic_audio))
-    elif SETTINGS.recording.mic_delay_ms > 0 and len(mic_audio) > delay:
-        mic_audio = mic_audio[delay:]
-    
-    diff = len(system_audio) - len(mic_audio)
-    if diff > 0:
-        mic_audio = np.vstack((mic_audio, np.zeros((diff, 2))))
-    elif diff < 0:
-        system_audio = np.vstack((system_audio, np.zeros((-diff, 2))))
-    
-    mixed = system_audio * 1.2 + mic_audio
-    peak = np.max(np.abs(mixed))
-    if peak > 1.0:
-        mixed = mixed / peak * 0.95
-    return mixed
+class SessionClock:
+    """録音セッションの共通タイムライン（一時停止していた時間を除いた単調時計）
+
+    各キャプチャスレッドは開始時と再開時のキャプチャ時刻をこのタイムライン上の
+    サンプル位置に変換して基準にする（SourceTimeline）ため、開始タイミングや
+    一時停止の境界がスレッドごとに異なっても同じ位置に揃う。
+    """
+    def __init__(self, sample_rate):
+        self.sample_rate = sample_rate
+        self.start = time.monotonic()
+        self.start_wall = time.time()
+        self.paused_at = None
+        self.paused_total = 0.0
+        self.pauses = []  # (一時停止したタイムライン位置, 一時停止していた秒数)
+    
+    def set_paused(self, paused):
+        now = time.monotonic()
+        if paused and self.paused_at is None:
+            self.paused_at = now
+        elif not paused and self.paused_at is not None:
+            self.pauses.append((self.position(self.paused_at), now - self.paused_at))
+            self.paused_total += now - self.paused_at
+            self.paused_at = None
+    
+    def position(self, timestamp):
+        """time.monotonic() の時刻をタイムライン上のサンプル位置に変換"""
+        return int(round((timestamp - self.start - self.paused_total) * self.sample_rate))
+    
+    def wall_time(self, position):
+        """タイムライン上の位置を実際の時刻（datetime）に変換"""
+        paused = sum(duration for pos, duration in self.pauses if pos <= position)
+        return datetime.fromtimestamp(self.start_wall + position / self.sample_rate + paused)
+
+def estimate_mic_delay(mic_audio, system_audio, sample_rate, seconds=60, max_lag_ms=500):
+    """マイクに回り込んだシステム音声との相互相関（FFT）からマイク遅延(ms)を推定
+
+    相関が弱く判断できない場合は None を返す。戻り値は mic_delay_ms と同じ向き
+    （正: マイクを早める）。
+    """
+    n = min(len(mic_audio), len(system_audio), int(seconds * sample_rate))
+    if n < sample_rate:
+        return None
+    mic = np.asarray(mic_audio[:n], dtype=np.float32).reshape(n, -1).mean(axis=1)
+    sys_ = np.asarray(system_audio[:n], dtype=np.float32).reshape(n, -1).mean(axis=1)
+    mic -= mic.mean()
+    sys_ -= sys_.mean()
+    energy = float(np.sqrt(np.dot(mic, mic) * np.dot(sys_, sys_)))
+    if energy == 0:
+        return None
+    size = 1 << int(np.ceil(np.log2(2 * n)))
+    corr = np.fft.irfft(np.fft.rfft(mic, size) * np.conj(np.fft.rfft(sys_, size)), size)
+    max_lag = int(sample_rate * max_lag_ms / 1000)
+    # corr[k] はマイクが k サンプル遅れている場合の相関（負の遅れは末尾側）
+    lags = np.concatenate((np.arange(0, max_lag + 1), np.arange(-max_lag, 0)))
+    candidates = np.concatenate((corr[:max_lag + 1], corr[-max_lag:]))
+    best = int(np.argmax(candidates))
+    if candidates[best] / energy < SETTINGS.recording.auto_delay_min_correlation:
+        return None
+    return int(round(lags[best] * 1000 / sample_rate))
+
+def mic_offset_samples(sample_rate, delay_ms=None):
+    """ミックス時のマイク開始位置（負の遅延設定は遅らせる、正は早める）
+
+    delay_ms を省略すると設定値（SETTINGS.recording.mic_delay_ms）を使う。
+    """
+    if delay_ms is None:
+        delay_ms = SETTINGS.recording.mic_delay_ms
+    delay = int(sample_rate * abs(delay_ms) / 1000)
+    return delay if delay_ms < 0 else -delay
+
+def mix_into(out, system_block, mic_block, mic_start, gain):
+    """out（float32, ステレオ）にシステム音声とマイク音声をミックスしてピークを返す
+
+    system_block は out の先頭から、mic_block は out[mic_start:] から配置する。
+    どちらも (n,), (n,1), (n,2) を受け付け、out 以外の配列は確保しない。
+    """
+    n_sys = min(len(out), len(system_block)) if system_block is not None else 0
+    if n_sys:
+        np.multiply(system_block[:n_sys].reshape(n_sys, -1), SETTINGS.recording.system_weight, out=out[:n_sys])
+    out[n_sys:] = 0
+    if mic_block is not None and len(mic_block):
+        mic_end = min(len(out), mic_start + len(mic_block))
+        if mic_end > mic_start:
+            out[mic_start:mic_end] += mic_block[:mic_end - mic_start].reshape(mic_end - mic_start, -1)
+    if gain != 1.0:
+        out *= gain
+    if len(out) == 0:
+        return 0.0
+    return float(max(out.max(), -out.min()))
+
+def mix_layout(mic_len, sys_len, sample_rate, delay_ms=None, aligned=False):
+    """ミックスの配置を返す: (マイク先頭の読み飛ばし数, マイクの配置位置, 全体の長さ)
+
+    マイク遅延は通常両方の音声がある場合だけ適用する。aligned=True では
+    片方がまだ空でも適用する（録音中エンコードで配置が途中で変わらないように）。
+    """
+    offset = mic_offset_samples(sample_rate, delay_ms) if aligned or (mic_len and sys_len) else 0
+    mic_skip = min(-offset, mic_len) if offset < 0 else 0
+    offset = max(offset, 0)
+    mic_len -= mic_skip
+    total = max(sys_len, mic_len + offset if mic_len else 0)
+    return mic_skip, offset, total
+
+def iter_mixed_blocks(mic_audio, system_audio, gain=1.0, out=None, begin=0, until=None, delay_ms=None,
+                      aligned=False):
+    """ミックス済みのブロックを (開始位置, ブロック, ピーク) として順に生成
+
+    入力は numpy 配列または ChunkedRecorder（スライスで範囲を読めるもの）。
+    out を渡すとその中にミックスし、省略時は1ブロック分の作業領域を使い回す。
+    begin/until で出力タイムライン上の範囲を限定できる。delay_ms はこの
+    ミックスだけに使うマイク遅延（省略時は設定値）。aligned は mix_layout を参照。
+    """
+    mic_len = len(mic_audio) if mic_audio is not None else 0
+    sys_len = len(system_audio) if system_audio is not None else 0
+    mic_skip, offset, total = mix_layout(mic_len, sys_len, SETTINGS.recording.sample_rate, delay_ms, aligned)
+    if until is not None:
+        total = min(total, until)
+    block = SETTINGS.recording.mix_block_frames
+    scratch = np.empty((block, 2), dtype=np.float32) if out is None else None
+    for start in range(begin, total, block):
+        end = min(total, start + block)
+        target = out[start:end] if out is not None else scratch[:end - start]
+        sys_block = system_audio[start:end] if start < sys_len else None
+        mic_from = max(0, start - offset)
+        mic_to = max(mic_from, end - offset)
+        mic_block = mic_audio[mic_skip + mic_from:mic_skip + mic_to] if mic_len else None
+        peak = mix_into(target, sys_block, mic_block, max(0, offset - start), gain)
+        yield start, target, peak
+
+def hidden_startupinfo():
+    """Windowsでffmpegのコンソールを表示しないための STARTUPINFO"""
+    if os.name != 'nt':
+        return None
+    startupinfo = subprocess.STARTUPINFO()
+    startupinfo.dwFlags |= subprocess.STARTF_USESHOWWINDOW
+    startupinfo.wShowWindow = subprocess.SW_HIDE
+    return startupinfo
+
+class StreamEncoder:
+    """float32ステレオのブロックを順に受け取り、ffmpegの標準入力経由でMP3へエンコード
+
+    ffmpegが見つからない場合は同じ場所へWAV（PCM_16）を逐次書き込む。
+    base_path は拡張子なしのパスで、実際の出力先は path 属性に入る。
+    """
+    def __init__(self, base_path, sample_rate, bitrate="192k"):
+        self.sample_rate = sample_rate
+        self.process = None
+        self.wav = None
+        ffmpeg = find_ffmpeg()
+        if ffmpeg:
+            self.path = base_path + ".mp3"
+            try:
+                self.process = subprocess.Popen([ffmpeg, '-y', '-hide_banner', '-loglevel', 'error',
+                    '-f', 'f32le', '-ar', str(sample_rate), '-ac', '2', '-i', 'pipe:0',
+                    '-codec:a', 'libmp3lame', '-b:a', bitrate, self.path],
+                    stdin=subprocess.PIPE, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE,
+                    startupinfo=hidden_startupinfo())
+                return
+            except OSError as e:
+                print(f"ffmpeg start error: {e}")
+        self.path = base_path + ".wav"
+        self.wav = sf.SoundFile(self.path, 'w', sample_rate, 2, subtype='PCM_16')
+    
+    def write(self, block):
+        if self.process:
+            self.process.stdin.write(np.ascontiguousarray(block, dtype=np.float32).tobytes())
+        else:
+            self.wav.write(block)
+    
+    def close(self):
+        """エンコードを完了して出力ファイルのパスを返す（失敗時は None）"""
+        if self.wav:
+            self.wav.close()
+            return self.path
+        try:
+            self.process.stdin.close()
+        except OSError:
+            pass
+        stderr = self.process.stderr.read()
+        if self.process.wait() != 0 or not os.path.exists(self.path):
+            print(f"ffmpeg error: {stderr.decode(errors='replace')}")
+            return None
+        return self.path
+
+class LiveEncoder:
+    """録音中にミックスとエンコードを進めるバックグラウンドステージ
+
+    interval 秒ごとに、共通タイムライン（SessionClock）上の現在位置から
+    live_encode_margin 秒手前までをミックスし、持続的なffmpegプロセス
+    （StreamEncoder）へ追記する。その位置までデータが届いていない音声
+    （何も再生していない間のループバックなど）は無音として扱う。後から届いた
+    分は ChunkedRecorder 側で無音埋めされた位置の続きに書かれる。全体のピークは
+    分からないためゲイン適用後は上限でクリップする。停止時は残りの数秒を
+    書き出すだけで済み、途中で異常終了しても再生可能な途中までのファイルが残る。
+    """
+    def __init__(self, mic_source, system_source, base_path, gain_getter, clock, interval=None):
+        self.mic_source = mic_source
+        self.system_source = system_source
+        self.gain_getter = gain_getter
+        self.clock = clock
+        self.interval = interval or SETTINGS.recording.live_encode_interval
+        self.encoder = StreamEncoder(base_path, SETTINGS.recording.sample_rate)
+        self.position = 0  # エンコード済みの出力位置
+        self.stop_event = threading.Event()
+        self.thread = threading.Thread(target=self._run, daemon=True)
+    
+    def start(self):
+        self.thread.start()
+        return self
+    
+    def _run(self):
+        while not self.stop_event.wait(self.interval):
+            try:
+                self._encode_available(final=False)
+            except Exception as e:
+                print(f"Live encode error: {e}")
+    
+    def _encode_available(self, final):
+        if final:
+            until = None
+        else:
+            # 一時停止中は一時停止した時点までしか進まない
+            now = self.clock.paused_at or time.monotonic()
+            until = self.clock.position(now) - int(SETTINGS.recording.live_encode_margin * self.clock.sample_rate)
+            if until <= self.position:
+                return
+        limit = SETTINGS.recording.peak_limit
+        gain = self.gain_getter()
+        for start, block, peak in iter_mixed_blocks(self.mic_source, self.system_source, gain,
+                                                    begin=self.position, until=until, aligned=True):
+            if peak > limit:
+                np.clip(block, -limit, limit, out=block)
+            self.encoder.write(block)
+            self.position = start + len(block)
+    
+    def stop(self):
+        """残りをエンコードして出力ファイルのパスを返す"""
+        self.stop_event.set()
+        self.thread.join()
+        try:
+            self._encode_available(final=True)
+        finally:
+            path = self.encoder.close()
+        return path
+
+def save_mixed_recording(mic_source, system_source, gain, base_path, delay_ms=None):
+    """録音バッファをミックスしながら直接エンコードして保存（中間WAVは作らない）
+
+    各バッファのピークからミックス後のピーク上限を見積もり、制限を超え得る
+    場合だけ事前にピークを走査する。保存先のパスを返す（音声がなければ None）。
+    """
+    rate = SETTINGS.recording.sample_rate
+    if mix_layout(len(mic_source), len(system_source), rate, delay_ms)[2] == 0:
+        return None
+    limit = SETTINGS.recording.peak_limit
+    scale = 1.0
+    mic_peak = getattr(mic_source, "peak", None)
+    sys_peak = getattr(system_source, "peak", None)
+    if mic_peak is None or sys_peak is None or (sys_peak * SETTINGS.recording.system_weight + mic_peak) * gain > limit:
+        peak = max(p for _, _, p in iter_mixed_blocks(mic_source, system_source, gain, delay_ms=delay_ms))
+        if peak > limit:
+            scale = limit / peak
+    
+    encoder = StreamEncoder(base_path, rate)
+    try:
+        for _, block, _ in iter_mixed_blocks(mic_source, system_source, gain, delay_ms=delay_ms):
+            if scale != 1.0:
+                block *= scale
+            encoder.write(block)
+    finally:
+        path = encoder.close()
+    return path
 
 def get_recent_recordings(limit=8):
     recordings = []
@@ -579,17 +2471,79 @@ def get_recent_recordings(limit=8):
                     except: pass
     return recordings[:limit]
 
+class UIChannel:
+    """ワーカースレッドからTkへの更新を1か所に集めるチャネル
+
+    post_state(key, value) は key ごとに最新の値だけを残して描画をまとめ、
+    post(callback) は投稿順にそのまま実行する。Tk の after で一定間隔ごとに
+    取り出すので、ワーカースレッドが直接 Tk に触れることはない。
+    """
+    def __init__(self, widget, rate_hz=None):
+        self.widget = widget
+        self.interval = int(1000 / (rate_hz or SETTINGS.ui.refresh_hz))
+        self.handlers = {}
+        self.tick_callbacks = []
+        self.states = {}
+        self.state_lock = threading.Lock()
+        self.events = queue.Queue()
+    
+    def on_state(self, key, handler):
+        """post_state(key, ...) の描画処理を登録"""
+        self.handlers[key] = handler
+    
+    def on_tick(self, callback):
+        """更新間隔ごとに呼ばれる処理を登録（アニメーション用）"""
+        self.tick_callbacks.append(callback)
+    
+    def post_state(self, key, value):
+        with self.state_lock:
+            self.states[key] = value
+    
+    def post(self, callback):
+        self.events.put(callback)
+    
+    def start(self):
+        self.widget.after(self.interval, self._pump)
+    
+    def _pump(self):
+        with self.state_lock:
+            states, self.states = self.states, {}
+        for key, value in states.items():
+            handler = self.handlers.get(key)
+            if handler:
+                try:
+                    handler(value)
+                except Exception as e:
+                    print(f"UI update error ({key}): {e}")
+        while True:
+            try:
+                callback = self.events.get_nowait()
+            except queue.Empty:
+                break
+            try:
+                callback()
+            except Exception as e:
+                print(f"UI callback error: {e}")
+                traceback.print_exc()
+        for callback in self.tick_callbacks:
+            try:
+                callback()
+            except Exception as e:
+                print(f"UI tick error: {e}")
+                traceback.print_exc()
+        self.widget.after(self.interval, self._pump)
+
 # ===== UI =====
 class MeetLogApp(ctk.CTk):
     def __init__(self):
+        global ui_channel
         super().__init__()
         load_settings()  # 設定読み込み
-        
-        # 保存されたAPIキーがあれば自動接続
-        if gemini_api_key:
-            gemini_assistant.configure(gemini_api_key)
+        ui_channel = UIChannel(self)
+        ui_channel.start()
         
         self.title(f"🎙️ {APP_NAME} v{APP_VERSION}")
+        self.protocol("WM_DELETE_WINDOW", self.on_close)
         self.geometry("1600x800")
         self.minsize(1400, 700)
         
@@ -633,22 +2587,68 @@ class MeetLogApp(ctk.CTk):
         self.assistant_panel = AssistantPanel(self)
         self.assistant_panel.grid(row=0, column=1, padx=(5, 10), pady=10, sticky="nsew")
         
-        # Gemini自動設定
+        # Gemini自動設定（接続確認に時間がかかるので表示後にバックグラウンドで）
         if gemini_api_key:
-            gemini_assistant.configure(gemini_api_key)
+            threading.Thread(target=self._configure_gemini, args=(gemini_api_key,), daemon=True).start()
+        
+        # 前回異常終了した録音の確認
+        self.after(500, self.check_unfinished_sessions)
     
     def show_settings(self):
         SettingsWindow(self)
     
-    def update_transcript(self, text):
-        """文字起こしを更新"""
-        self.assistant_panel.add_transcript(text)
+    def on_close(self):
+        """ウィンドウを閉じるときにバックグラウンドのデバイス監視を止める"""
+        device_registry.stop()
+        self.destroy()
+    
+    def _configure_gemini(self, api_key):
+        """保存済みAPIキーでGeminiに接続（バックグラウンド）"""
+        if gemini_assistant.configure(api_key):
+            ui_channel.post(self.assistant_panel.update_status)
+    
+    def check_unfinished_sessions(self):
+        """正常に保存されなかった録音があれば復元を提案"""
+        for session_dir in find_unfinished_sessions():
+            answer = messagebox.askyesnocancel("録音の復元",
+                f"前回の録音（{os.path.basename(session_dir)}）が正常に保存されていません。\n\n"
+                "録音データから復元しますか？\n（いいえ: 録音データを削除 / キャンセル: 次回起動時に確認）")
+            if answer is None:
+                continue
+            if answer:
+                threading.Thread(target=self._recover_session, args=(session_dir,), daemon=True).start()
+            else:
+                for name in os.listdir(session_dir):
+                    if name.endswith(".raw"):
+                        os.remove(os.path.join(session_dir, name))
+                remove_session_manifest(session_dir)
+    
+    def _recover_session(self, session_dir):
+        try:
+            path = recover_session(session_dir)
+            if path:
+                ui_channel.post(lambda: messagebox.showinfo(t("recording_complete"), f"復元: {os.path.abspath(path)}"))
+                ui_channel.post(self.history_frame.refresh)
+            else:
+                ui_channel.post(lambda: messagebox.showwarning("録音の復元",
+                    f"前回の録音（{os.path.basename(session_dir)}）には音声が含まれていなかったため、録音データを削除しました。"))
+        except Exception as e:
+            traceback.print_exc()
+            ui_channel.post(lambda e=e: messagebox.showerror(t("error"), f"録音の復元に失敗しました: {e}"))
+    
+    def update_transcript(self, text, timestamp=None):
+        """文字起こしを更新（timestamp は発話時刻の datetime）"""
+        self.assistant_panel.add_transcript(text, timestamp)
 
 # ===== 会議補助パネル =====
 class AssistantPanel(ctk.CTkFrame):
     def __init__(self, parent):
         super().__init__(parent, fg_color=THEME.colors.bg_panel, corner_radius=15)
         self.parent = parent
+        self.active_request = None  # 実行中のAI生成（新しい操作で取り消す）
+        self.stream_lock = threading.Lock()
+        self.stream_pending = []  # (リクエスト, 差分テキスト)
+        ui_channel.on_tick(self._flush_stream)
         self.grid_columnconfigure(0, weight=1)
         self.grid_rowconfigure(1, weight=1)
         self.grid_rowconfigure(3, weight=1)
@@ -680,6 +2680,12 @@ class AssistantPanel(ctk.CTkFrame):
         self.transcript_text = ctk.CTkTextbox(transcript_frame, height=200, font=ctk.CTkFont(size=12))
         self.transcript_text.grid(row=1, column=0, padx=10, pady=5, sticky="nsew")
         
+        # 認識途中の文（ローカルエンジン使用時）
+        self.partial_label = ctk.CTkLabel(transcript_frame, text="", anchor="w", font=ctk.CTkFont(size=12),
+            text_color=THEME.colors.text_muted)
+        self.partial_label.grid(row=2, column=0, padx=10, pady=(0, 5), sticky="ew")
+        ui_channel.on_state("partial_transcript", lambda text: self.partial_label.configure(text=text and f"… {text}"))
+        
         # ボタンエリア（上段：文字起こしから）
         btn_frame = ctk.CTkFrame(self, fg_color="transparent")
         btn_frame.grid(row=2, column=0, padx=10, pady=5, sticky="ew")
@@ -721,6 +2727,10 @@ class AssistantPanel(ctk.CTkFrame):
         ctk.CTkButton(tab_header, text="📋", width=30, height=25, command=self.copy_output).pack(side="right", padx=2)
         ctk.CTkButton(tab_header, text="💾", width=30, height=25, command=self.save_output).pack(side="right", padx=2)
         
+        # キャッシュのヒット数
+        self.cache_label = ctk.CTkLabel(tab_header, text="", font=ctk.CTkFont(size=10), text_color=THEME.colors.text_muted)
+        self.cache_label.pack(side="right", padx=8)
+        
         # 各タブのテキストエリア
         self.output_texts = {}
         for tab_id, _ in tabs:
@@ -750,10 +2760,10 @@ class AssistantPanel(ctk.CTkFrame):
         else:
             self.status_label.configure(text="⚪ 未設定", text_color=THEME.colors.text_muted)
     
-    def add_transcript(self, text):
+    def add_transcript(self, text, timestamp=None):
         """文字起こしを追加"""
         if text.strip():
-            timestamp = datetime.now().strftime('%H:%M:%S')
+            timestamp = (timestamp or datetime.now()).strftime('%H:%M:%S')
             # 読みやすくするため改行を追加
             self.transcript_text.insert("end", f"[{timestamp}]\n{text}\n\n")
             self.transcript_text.see("end")
@@ -765,6 +2775,7 @@ class AssistantPanel(ctk.CTkFrame):
     def clear_transcript(self):
         self.transcript_text.delete("1.0", "end")
         current_transcript.clear()
+        gemini_assistant.remember("")  # 別の会議へ前回の要点を持ち込まない
     
     def generate_minutes(self):
         """議事録生成"""
@@ -777,14 +2788,13 @@ class AssistantPanel(ctk.CTkFrame):
             return
         
         self.switch_tab("minutes")
-        self.output_texts["minutes"].delete("1.0", "end")
-        self.output_texts["minutes"].insert("end", "⏳ 議事録を生成中...")
-        
-        def generate():
-            result = gemini_assistant.generate_minutes(transcript)
-            self.after(0, lambda: self._show_result("minutes", result))
-        
-        threading.Thread(target=generate, daemon=True).start()
+        # 同じ文字起こしで生成済みならキャッシュから即表示
+        cached = gemini_assistant.cached_response("minutes", transcript)
+        if cached is not None:
+            self._cancel_request()
+            self._show_result("minutes", cached)
+            return
+        self._start_request("minutes", "⏳ 議事録を生成中...", gemini_assistant.generate_minutes, transcript)
     
     def suggest_questions(self):
         """疑問点を提案"""
@@ -797,14 +2807,13 @@ class AssistantPanel(ctk.CTkFrame):
             return
         
         self.switch_tab("questions")
-        self.output_texts["questions"].delete("1.0", "end")
-        self.output_texts["questions"].insert("end", "⏳ 疑問点を分析中...")
-        
-        def suggest():
-            result = gemini_assistant.suggest_questions(transcript)
-            self.after(0, lambda: self._show_result("questions", result))
-        
-        threading.Thread(target=suggest, daemon=True).start()
+        # 同じ文字起こしで生成済みならキャッシュから即表示
+        cached = gemini_assistant.cached_response("questions", transcript)
+        if cached is not None:
+            self._cancel_request()
+            self._show_result("questions", cached)
+            return
+        self._start_request("questions", "⏳ 疑問点を分析中...", gemini_assistant.suggest_questions, transcript)
     
     def summarize(self):
         """要約"""
@@ -817,18 +2826,66 @@ class AssistantPanel(ctk.CTkFrame):
             return
         
         self.switch_tab("summary")
-        self.output_texts["summary"].delete("1.0", "end")
-        self.output_texts["summary"].insert("end", "⏳ 要約を生成中...")
+        # 同じ文字起こしで生成済みならキャッシュから即表示
+        cached = gemini_assistant.cached_response("summary", transcript)
+        if cached is not None:
+            self._cancel_request()
+            self._show_result("summary", cached)
+            return
+        self._start_request("summary", "⏳ 要約を生成中...", gemini_assistant.summarize_realtime, transcript)
+    
+    def _start_request(self, tab_id, placeholder, generate, transcript):
+        """生成を開始（実行中のものは取り消す）。差分はUIの更新間隔ごとにまとめて描画"""
+        self._cancel_request()
+        request = SimpleNamespace(tab_id=tab_id, cancel=threading.Event(), streamed="", started=False)
+        self.active_request = request
+        self.output_texts[tab_id].delete("1.0", "end")
+        self.output_texts[tab_id].insert("end", placeholder)
+        
+        def on_delta(delta):
+            with self.stream_lock:
+                self.stream_pending.append((request, delta))
         
-        def do_summarize():
-            result = gemini_assistant.summarize_realtime(transcript)
-            self.after(0, lambda: self._show_result("summary", result))
+        def run():
+            result = generate(transcript, use_cache=False, on_delta=on_delta, cancel=request.cancel)
+            ui_channel.post(lambda: self._finish_request(request, result))
         
-        threading.Thread(target=do_summarize, daemon=True).start()
+        threading.Thread(target=run, daemon=True).start()
+    
+    def _cancel_request(self):
+        if self.active_request:
+            self.active_request.cancel.set()
+            self.active_request = None
+    
+    def _flush_stream(self):
+        """溜まった差分を出力タブへ追記（UIチャネルの更新ごとに呼ばれる）"""
+        with self.stream_lock:
+            pending, self.stream_pending = self.stream_pending, []
+        for request, delta in pending:
+            if request is not self.active_request:
+                continue  # 取り消し済み
+            widget = self.output_texts[request.tab_id]
+            if not request.started:
+                widget.delete("1.0", "end")
+                request.started = True
+            widget.insert("end", delta)
+            request.streamed += delta
+    
+    def _finish_request(self, request, result):
+        self._flush_stream()
+        if request is not self.active_request or result is None:
+            return
+        self.active_request = None
+        # エラー文など、ストリームと異なる結果になった場合だけ置き換える
+        if result != request.streamed:
+            self._show_result(request.tab_id, result)
+        else:
+            self.cache_label.configure(text=gemini_assistant.response_cache.stats_text())
     
     def _show_result(self, tab_id, result):
         self.output_texts[tab_id].delete("1.0", "end")
         self.output_texts[tab_id].insert("end", result)
+        self.cache_label.configure(text=gemini_assistant.response_cache.stats_text())
     
     def generate_from_file(self):
         """音声ファイルから議事録を生成"""
@@ -850,23 +2907,24 @@ class AssistantPanel(ctk.CTkFrame):
         if not file_path:
             return
         
+        self._cancel_request()
         self.switch_tab("minutes")
         self.output_texts["minutes"].delete("1.0", "end")
         self.output_texts["minutes"].insert("end", f"⏳ 処理中: {os.path.basename(file_path)}\n\n")
         
         def process():
             def update_progress(msg):
-                self.after(0, lambda: self._update_progress(msg))
+                ui_channel.post(lambda: self._update_progress(msg))
             
             result, error = gemini_assistant.transcribe_audio_file(file_path, update_progress)
             
             if error:
-                self.after(0, lambda: self._show_result("minutes", f"❌ エラー: {error}"))
+                ui_channel.post(lambda: self._show_result("minutes", f"❌ エラー: {error}"))
             else:
                 # 文字起こしを表示エリアに追加
-                self.after(0, lambda: self.transcript_text.insert("end", f"【ファイル: {os.path.basename(file_path)}】\n{result['transcript']}\n\n"))
+                ui_channel.post(lambda: self.transcript_text.insert("end", f"【ファイル: {os.path.basename(file_path)}】\n{result['transcript']}\n\n"))
                 # 議事録を表示
-                self.after(0, lambda: self._show_result("minutes", result['minutes']))
+                ui_channel.post(lambda: self._show_result("minutes", result['minutes']))
         
         threading.Thread(target=process, daemon=True).start()
     
@@ -902,33 +2960,50 @@ class SourceFrame(ctk.CTkFrame):
     def __init__(self, parent):
         super().__init__(parent)
         self.grid_columnconfigure((1, 3), weight=1)
+        self.mics = {}  # 表示名 -> デバイスID
+        self.systems = {}
         
         ctk.CTkLabel(self, text=t("mic_source")).grid(row=0, column=0, padx=10, pady=8, sticky="w")
-        self.mics = [m.name for m in sc.all_microphones(include_loopback=False)]
-        self.mic_var = ctk.StringVar(value=self.mics[0] if self.mics else "")
-        ctk.CTkOptionMenu(self, values=self.mics, variable=self.mic_var, command=self.on_mic, width=250).grid(row=0, column=1, padx=5, pady=8, sticky="ew")
+        self.mic_var = ctk.StringVar(value="読み込み中...")
+        self.mic_menu = ctk.CTkOptionMenu(self, values=[], variable=self.mic_var, command=self.on_mic, width=250)
+        self.mic_menu.grid(row=0, column=1, padx=5, pady=8, sticky="ew")
         
         ctk.CTkLabel(self, text=t("system_source")).grid(row=0, column=2, padx=10, pady=8, sticky="w")
-        self.systems = [m.name for m in sc.all_microphones(include_loopback=True)]
-        self.system_var = ctk.StringVar(value=self.systems[0] if self.systems else "")
-        ctk.CTkOptionMenu(self, values=self.systems, variable=self.system_var, command=self.on_system, width=250).grid(row=0, column=3, padx=5, pady=8, sticky="ew")
+        self.system_var = ctk.StringVar(value="読み込み中...")
+        self.system_menu = ctk.CTkOptionMenu(self, values=[], variable=self.system_var, command=self.on_system, width=250)
+        self.system_menu.grid(row=0, column=3, padx=5, pady=8, sticky="ew")
         
+        # デバイス列挙は遅いのでウィンドウ表示後にバックグラウンドで（抜き差しも反映）
+        device_registry.add_listener(self._load_devices)
+        device_registry.start()
+    
+    def _load_devices(self):
+        mics = [(m.name, m.id) for m in device_registry.microphones()]
+        systems = [(m.name, m.id) for m in device_registry.microphones(loopback=True)]
+        ui_channel.post(lambda: self._set_devices(mics, systems))
+    
+    def _set_devices(self, mics, systems):
+        self.mics = dict(mics)
+        self.systems = dict(systems)
+        self.mic_menu.configure(values=list(self.mics))
+        self.system_menu.configure(values=list(self.systems))
+        # 選択中のデバイスが残っていればそのまま
+        if self.mic_var.get() not in self.mics:
+            self.mic_var.set(mics[0][0] if mics else "")
+        if self.system_var.get() not in self.systems:
+            self.system_var.set(systems[0][0] if systems else "")
         self.on_mic(self.mic_var.get())
         self.on_system(self.system_var.get())
     
     def on_mic(self, name):
         global input_source_id
-        for m in sc.all_microphones(include_loopback=False):
-            if m.name == name:
-                input_source_id = m.id
-                break
+        if name in self.mics:
+            input_source_id = self.mics[name]
     
     def on_system(self, name):
         global system_source_id
-        for m in sc.all_microphones(include_loopback=True):
-            if m.name == name:
-                system_source_id = m.id
-                break
+        if name in self.systems:
+            system_source_id = self.systems[name]
 
 class RecordingFrame(ctk.CTkFrame):
     def __init__(self, parent, app_ref=None):
@@ -936,12 +3011,15 @@ class RecordingFrame(ctk.CTkFrame):
         self.app_ref = app_ref
         self.speech_thread = None
         self.speech_running = False
+        self.speech_reader = None  # 音声認識用のマイクハブの読み手
         self.system_speech_thread = None
         self.system_speech_running = False
+        self.system_engine = None
         self.grid_columnconfigure(0, weight=1)
         
         self.label_time = ctk.CTkLabel(self, text="00:00:00", font=ctk.CTkFont(size=48, weight="bold"))
         self.label_time.grid(row=0, column=0, pady=15)
+        ui_channel.on_state("recording_clock", self._update_clock)
         
         btn = ctk.CTkFrame(self, fg_color="transparent")
         btn.grid(row=1, column=0, pady=10)
@@ -969,201 +3047,299 @@ class RecordingFrame(ctk.CTkFrame):
         ctk.CTkLabel(vol_frame, text="音量:", font=ctk.CTkFont(size=11)).pack(side="left", padx=3)
         self.vol_label = ctk.CTkLabel(vol_frame, text="150%", width=50)
         self.vol_label.pack(side="right", padx=5)
+        self.gain = volume_gain.get()  # ワーカースレッドはTk変数ではなくこちらを読む
         vol_slider = ctk.CTkSlider(vol_frame, from_=0.5, to=3.0, variable=volume_gain, width=200,
-            command=lambda v: self.vol_label.configure(text=f"{int(v*100)}%"))
+            command=self._on_volume)
         vol_slider.pack(side="left", padx=5)
+        
+        # レベルメーター（マイク / システム / ゲイン適用後のミックス）
+        meter_frame = ctk.CTkFrame(self, fg_color="transparent")
+        meter_frame.grid(row=3, column=0, padx=10, pady=(0, 10), sticky="ew")
+        meter_frame.grid_columnconfigure(1, weight=1)
+        self.meters = {}
+        self.meter_frames = {"mic": [], "system": []}
+        self.meter_levels = {"mic": (0.0, 0.0), "system": (0.0, 0.0)}
+        self.meter_idle = {"mic": 0, "system": 0}  # フレームが届かなかった連続更新回数
+        for i, (key, label) in enumerate([("mic", "マイク"), ("system", "システム"), ("mix", "ミックス")]):
+            ctk.CTkLabel(meter_frame, text=label, font=ctk.CTkFont(size=10), width=50, anchor="w").grid(row=i, column=0, sticky="w")
+            bar = ctk.CTkProgressBar(meter_frame, height=8, progress_color=THEME.colors.secondary)
+            bar.set(0)
+            bar.grid(row=i, column=1, padx=5, pady=2, sticky="ew")
+            self.meters[key] = bar
+        ui_channel.on_state("level_mic", lambda frames: self.meter_frames["mic"].extend(frames))
+        ui_channel.on_state("level_system", lambda frames: self.meter_frames["system"].extend(frames))
+        ui_channel.on_tick(self._tick_meters)
+    
+    def _on_volume(self, v):
+        self.gain = float(v)
+        self.vol_label.configure(text=f"{int(v*100)}%")
+    
+    def _tick_meters(self):
+        """届いたレベルを1更新ごとに1フレームずつ描画
+
+        約1秒フレームが届かない音声（無音中のループバックなど）は0に戻す。
+        """
+        for key, frames in self.meter_frames.items():
+            if frames:
+                # 遅れがたまった場合は古いフレームを捨てる
+                del frames[:max(0, len(frames) - SETTINGS.ui.refresh_hz)]
+                self.meter_levels[key] = frames.pop(0)
+                self.meter_idle[key] = 0
+            else:
+                self.meter_idle[key] += 1
+                if not recording or self.meter_idle[key] >= SETTINGS.ui.refresh_hz:
+                    self.meter_levels[key] = (0.0, 0.0)
+        mic_rms, mic_peak = self.meter_levels["mic"]
+        sys_rms, sys_peak = self.meter_levels["system"]
+        weight = SETTINGS.recording.system_weight
+        gain = volume_gain.get()
+        # ミックスは無相関とみなしたRMSとピークの上限から見積もる
+        mix = (gain * float(np.hypot(weight * sys_rms, mic_rms)), gain * (weight * sys_peak + mic_peak))
+        for key, (rms, peak) in (("mic", self.meter_levels["mic"]), ("system", self.meter_levels["system"]), ("mix", mix)):
+            db = 20 * np.log10(max(rms, 1e-6))
+            self.meters[key].set(min(1.0, max(0.0, (db + 60) / 60)))
+            # 停止後の保存では全体のピークに合わせて縮小するので、ミックスが実際に
+            # クリップするのは録音中エンコード（上限で切り詰める）の場合だけ
+            clipping = peak >= 0.99 and (key != "mix" or SETTINGS.recording.live_encode)
+            self.meters[key].configure(progress_color=THEME.colors.danger if clipping else THEME.colors.secondary)
+    
+    def _update_clock(self, state):
+        """録音スレッドから届いた経過サンプル数で時計を描画"""
+        if not recording:
+            return
+        position, paused = state
+        if paused:
+            self.label_time.configure(text=t("paused"), text_color=THEME.colors.warning)
+            return
+        elapsed = position / SETTINGS.recording.sample_rate
+        icon = "● " if int(elapsed * 2) % 2 == 0 else "○ "
+        self.label_time.configure(text=icon + convert_seconds(elapsed), text_color=THEME.colors.danger)
     
     def start_speech_recognition(self):
         """リアルタイム音声認識を開始"""
-        if not SPEECH_RECOGNITION_AVAILABLE:
-            print("SpeechRecognition not available")
+        engine = get_transcription_engine(SETTINGS.transcription.mic_engine, "google")
+        if engine is None:
+            print("No transcription engine available for mic")
             return
         
-        print("Starting speech recognition...")
+        print(f"Starting speech recognition ({engine.name})...")
         self.speech_running = True
+        # マイクは録音スレッドが開いているので、ハブから16kHzモノラルで受け取る
+        self.speech_reader = mic_hub.subscribe(rate=SETTINGS.transcription.sample_rate, channels=1)
+        target = self._stream_loop if engine.streaming else self._phrase_loop
+        self.speech_thread = threading.Thread(target=target, args=(engine, self.speech_reader), daemon=True)
+        self.speech_thread.start()
+        print("Speech recognition thread started")
+    
+    def _stream_loop(self, engine, reader):
+        """逐次認識できるエンジンへ小さなフレームを渡し、途中結果と確定結果を表示"""
+        try:
+            stream = engine.open_stream(reader.rate)
+            frame = int(reader.rate * SETTINGS.transcription.stream_frame_ms / 1000)
+            partial = ""
+            while self.speech_running and recording:
+                data = reader.read(frame, timeout=0.5)
+                if len(data) == 0:
+                    continue
+                finals, new_partial = stream.feed(data[:, 0])
+                for text in finals:
+                    self._deliver_phrase(text)
+                if new_partial != partial:
+                    partial = new_partial
+                    ui_channel.post_state("partial_transcript", partial)
+            text = stream.flush()
+            if text:
+                self._deliver_phrase(text)
+        except Exception as e:
+            print(f"Speech stream error: {e}")
+            traceback.print_exc()
+        finally:
+            ui_channel.post_state("partial_transcript", "")
+    
+    def _phrase_loop(self, engine, reader):
+        """speech_recognition の発話区切りで1フレーズずつエンジンへ渡す"""
         recognizer = sr.Recognizer()
         recognizer.energy_threshold = 150  # 感度を上げる
         recognizer.dynamic_energy_threshold = False  # 固定閾値
         recognizer.pause_threshold = 0.5  # 短い沈黙で区切る
-        
-        def recognize_loop():
-            try:
-                # 利用可能なマイクを表示
-                mic_list = sr.Microphone.list_microphone_names()
-                print(f"Available mics for speech recognition: {mic_list[:5]}...")
-                
-                # 録音用に選択されたマイクを探す
-                mic_index = None
-                for i, name in enumerate(mic_list):
-                    if input_source_id and str(input_source_id) in name:
-                        mic_index = i
-                        break
+        try:
+            with hub_speech_source(reader) as source:
+                recognizer.adjust_for_ambient_noise(source, duration=0.5)
+                print("Listening for speech...")
                 
-                # マイクを指定して開く
-                with sr.Microphone(device_index=mic_index) as source:
-                    print(f"Using mic index {mic_index}: {mic_list[mic_index] if mic_index and mic_index < len(mic_list) else 'default'}")
-                    recognizer.adjust_for_ambient_noise(source, duration=0.5)
-                    print("Listening for speech...")
-                    
-                    while self.speech_running and recording:
-                        try:
-                            audio = recognizer.listen(source, timeout=5, phrase_time_limit=10)
-                            print(f"Audio captured: {len(audio.frame_data)} bytes")
-                            try:
-                                text = recognizer.recognize_google(audio, language="ja-JP")
-                                print(f"Recognized: {text}")
-                                if text and self.app_ref:
-                                    self.after(0, lambda t=text: self.app_ref.update_transcript(t))
-                            except sr.UnknownValueError:
-                                pass  # 無音または認識不可
-                            except sr.RequestError as e:
-                                print(f"Google API error: {e}")
-                        except sr.WaitTimeoutError:
-                            pass  # タイムアウトは正常
-                        except Exception as e:
-                            print(f"Recognition error: {e}")
-            except Exception as e:
-                print(f"Microphone init error: {e}")
-                traceback.print_exc()
-        
-        self.speech_thread = threading.Thread(target=recognize_loop, daemon=True)
-        self.speech_thread.start()
-        print("Speech recognition thread started")
+                while self.speech_running and recording:
+                    try:
+                        audio = recognizer.listen(source, timeout=5, phrase_time_limit=10)
+                        print(f"Audio captured: {len(audio.frame_data)} bytes")
+                        pcm = np.frombuffer(audio.frame_data, dtype='<i2').astype(np.float32) / 32768
+                        self._deliver_phrase(engine.transcribe(pcm, audio.sample_rate))
+                    except sr.WaitTimeoutError:
+                        pass  # タイムアウトは正常
+                    except sr.RequestError as e:
+                        print(f"Google API error: {e}")
+                    except Exception as e:
+                        print(f"Recognition error: {e}")
+        except Exception as e:
+            print(f"Microphone init error: {e}")
+            traceback.print_exc()
+    
+    def _deliver_phrase(self, text):
+        if text:
+            print(f"Recognized: {text}")
+            if self.app_ref:
+                ui_channel.post(lambda: self.app_ref.update_transcript(text))
     
     def stop_speech_recognition(self):
         """音声認識を停止"""
         self.speech_running = False
+        if self.speech_reader:
+            mic_hub.unsubscribe(self.speech_reader)
+            self.speech_reader = None
         self.system_speech_running = False
     
     def start_system_audio_recognition(self):
         """システム音声（YouTube等）の文字起こし - 発話区切り検出"""
-        if not gemini_assistant.is_configured:
-            print("Gemini not configured for system audio recognition")
+        global system_vad
+        self.system_engine = get_transcription_engine(SETTINGS.transcription.system_engine, "gemini")
+        if self.system_engine is None:
+            print("No transcription engine available for system audio")
             return
         
-        print("Starting system audio recognition with Gemini...")
+        print(f"Starting system audio recognition ({self.system_engine.name})...")
         self.system_speech_running = True
-        self.last_processed_position = 0
+        self.last_processed_position = system_buffer.total_written
+        vad = VoiceActivityDetector(SETTINGS.recording.sample_rate)
+        vad.position = self.last_processed_position
+        system_vad = vad
+        self.transcription_pool = TranscriptionPool(self._transcribe_segment, self._deliver_segment)
+        self.chunk_scheduler = ChunkScheduler(log_path=os.path.join(self.backup_dir, "transcription_log.jsonl"))
         
         def recognize_system_loop():
-            last_process_time = time.time()
-            silence_start = None
-            MIN_INTERVAL = 10  # 最低10秒間隔
-            MAX_INTERVAL = 30  # 最大30秒で強制処理
-            SILENCE_THRESHOLD = 0.02  # 無音判定の閾値（高めに設定）
-            SILENCE_DURATION = 0.8  # 無音が続く時間（秒）
+            global system_vad
+            rate = SETTINGS.recording.sample_rate
+            scheduler = self.chunk_scheduler
+            has_speech = False
             
             while self.system_speech_running and recording:
-                time.sleep(0.1)
-                
-                elapsed = time.time() - last_process_time
+                try:
+                    kind, position = vad.events.get(timeout=0.1)
+                except queue.Empty:
+                    kind, position = None, None
                 
-                # 最低10秒経過していない場合はスキップ
-                if elapsed < MIN_INTERVAL:
-                    continue
+                target = scheduler.chunk_seconds(self.transcription_pool.pending)
+                if kind == "speech_start":
+                    has_speech = True
+                elif kind == "speech_end":
+                    # 発話の切れ目で区切る（目標の長さに満たない場合は次の切れ目まで待つ）
+                    length = position - self.last_processed_position
+                    if length >= target * rate:
+                        print(f"Silence detected after {length / rate:.1f}s (target {target:.1f}s), processing...")
+                        self._process_system_audio(position)
+                        has_speech = vad.in_speech
                 
-                if system_buffer and system_buffer.total_written > 0:
-                    audio_data = system_buffer.get_all_data()
-                    
-                    # 最新0.5秒の音量をチェック
-                    recent_samples = int(SETTINGS.recording.sample_rate * 0.5)
-                    if len(audio_data) > recent_samples:
-                        recent_audio = audio_data[-recent_samples:]
-                        volume = float(np.abs(recent_audio).mean())
-                        
-                        # 無音検出
-                        if volume < SILENCE_THRESHOLD:
-                            if silence_start is None:
-                                silence_start = time.time()
-                            elif time.time() - silence_start >= SILENCE_DURATION:
-                                # 無音が続いた→区切りとして処理
-                                print(f"Silence detected after {elapsed:.1f}s, processing...")
-                                self._process_system_audio(elapsed)
-                                last_process_time = time.time()
-                                silence_start = None
-                        else:
-                            silence_start = None
-                        
-                        # 最大60秒で強制処理
-                        if elapsed >= MAX_INTERVAL:
-                            print(f"Max interval reached ({MAX_INTERVAL}s), forcing process...")
-                            self._process_system_audio(elapsed)
-                            last_process_time = time.time()
-                            silence_start = None
+                # 切れ目がないまま長くなりすぎたら強制処理
+                current = system_buffer.total_written
+                limit = min(target * 1.5, scheduler.max_seconds) if has_speech else scheduler.max_seconds
+                if current - self.last_processed_position >= limit * rate:
+                    if has_speech:
+                        print(f"Max interval reached ({limit:.1f}s), forcing process...")
+                        self._process_system_audio(current)
+                    else:
+                        # 発話がなければ送信せずに読み飛ばす
+                        self.last_processed_position = current
+                    has_speech = vad.in_speech
+            
+            if system_vad is vad:
+                system_vad = None
+            # 送信済みのリクエストは完了次第表示される
+            self.transcription_pool.shutdown()
         
         self.system_speech_thread = threading.Thread(target=recognize_system_loop, daemon=True)
         self.system_speech_thread.start()
         print("System audio recognition thread started")
     
-    def _process_system_audio(self, duration):
-        """システム音声をGeminiで文字起こし"""
+    def _process_system_audio(self, end=None):
+        """前回処理位置から end までのシステム音声を文字起こしプールへ投入"""
         try:
-            audio_data = system_buffer.get_all_data()
-            
-            # 処理する音声の長さを計算
-            samples_to_process = int(duration * SETTINGS.recording.sample_rate)
-            if samples_to_process > len(audio_data):
-                samples_to_process = len(audio_data)
-            
-            audio_chunk = audio_data[-samples_to_process:]
-            
-            # 音声が短すぎる場合はスキップ
-            if len(audio_chunk) < SETTINGS.recording.sample_rate * 3:
+            if end is None:
+                end = system_buffer.total_written
+            # 音声が短すぎる場合は次回にまとめて処理
+            if end - self.last_processed_position < SETTINGS.recording.sample_rate * 3:
                 return
             
-            # 一時ファイルに保存
-            temp_path = os.path.join(SETTINGS.paths.recordings, "temp_system.wav")
-            sf.write(temp_path, audio_chunk, SETTINGS.recording.sample_rate)
-            
-            # Geminiで文字起こし
-            try:
-                with open(temp_path, 'rb') as f:
-                    audio_bytes = f.read()
-                
-                response = gemini_assistant.model.generate_content([
-                    "この音声を日本語で文字起こししてください。話者の発言内容のみを正確に出力してください。音声がない場合や聞き取れない場合は「なし」と返してください。",
-                    {
-                        "mime_type": "audio/wav",
-                        "data": base64.b64encode(audio_bytes).decode('utf-8')
-                    }
-                ])
-                text = response.text.strip()
-                if text and text != "なし" and text != "空" and len(text) > 2:
-                    print(f"System audio recognized ({duration:.1f}s): {text[:50]}...")
-                    if self.app_ref:
-                        self.after(0, lambda t=text: self.app_ref.update_transcript(t))
-            except Exception as e:
-                print(f"Gemini transcription error: {e}")
-            
-            # 一時ファイル削除
-            try:
-                os.remove(temp_path)
-            except:
-                pass
+            start = self.last_processed_position
+            audio_chunk = system_buffer.read(start, end)
+            self.last_processed_position += len(audio_chunk)
+            segment = SimpleNamespace(
+                audio=audio_chunk, start=start, end=start + len(audio_chunk),
+                timestamp=session_clock.wall_time(start))
+            # プールが埋まっている間はここで待つ（バックプレッシャー）
+            self.transcription_pool.submit(segment)
         except Exception as e:
             print(f"System audio processing error: {e}")
     
+    def _transcribe_segment(self, segment):
+        """ワーカースレッドでセグメントを文字起こしし、応答時間をスケジューラへ記録"""
+        stats = {}
+        started = time.monotonic()
+        text = self.system_engine.transcribe(segment.audio, SETTINGS.recording.sample_rate, stats)
+        duration = (segment.end - segment.start) / SETTINGS.recording.sample_rate
+        self.chunk_scheduler.record(duration, time.monotonic() - started, stats.get("tokens"),
+            self.transcription_pool.pending, stats.get("bytes"))
+        if text:
+            print(f"System audio recognized ({duration:.1f}s): {text[:50]}...")
+        return text
+    
+    def _deliver_segment(self, segment, text):
+        """時系列順に並べ直された結果を文字起こし欄へ追加"""
+        if self.app_ref:
+            ui_channel.post(lambda: self.app_ref.update_transcript(text, segment.timestamp))
+    
     def toggle_recording(self):
-        global recording, mic_buffer, system_buffer, recording_start_time, last_recording_path
+        global recording, mic_buffer, system_buffer, mic_queue, system_queue, session_clock
+        global recording_start_time, last_recording_path, mic_hub, system_hub
         
         if not recording:
             if input_source_id is None or system_source_id is None:
                 messagebox.showerror(t("error"), "入力ソースを選択してください")
                 return
             
+            backup_dir = os.path.join(SETTINGS.paths.recordings, datetime.now().strftime('%Y%m%d_%H%M%S'))
+            os.makedirs(backup_dir, exist_ok=True)
+            self.backup_dir = backup_dir
+            
+            mic_buffer = ChunkedRecorder(os.path.join(backup_dir, "mic.raw"), SETTINGS.recording.sample_rate, 1)
+            system_buffer = ChunkedRecorder(os.path.join(backup_dir, "system.raw"), SETTINGS.recording.sample_rate, 2)
+            write_session_manifest(backup_dir, {"mic": mic_buffer, "system": system_buffer}, volume_gain.get())
+            mic_queue = make_capture_ring(1)
+            system_queue = make_capture_ring(2)
+            # デバイスは録音スレッドだけが開き、音声認識などはハブから受け取る
+            mic_hub = CaptureHub(SETTINGS.recording.sample_rate, 1)
+            system_hub = CaptureHub(SETTINGS.recording.sample_rate, 2)
+            system_hub.add_listener(feed_system_vad)
+            # 最大録音時間に達したら自動停止（UIスレッドで停止処理を行う）
+            self.capture_pump = CapturePump(
+                limit_frames=SETTINGS.recording.max_duration_seconds * SETTINGS.recording.sample_rate,
+                on_limit=lambda: ui_channel.post(self._stop_at_limit))
+            self.capture_pump.add(mic_queue, mic_buffer, mic_hub.publish)
+            self.capture_pump.add(system_queue, system_buffer, system_hub.publish)
+            self.capture_pump.start()
+            session_clock = SessionClock(SETTINGS.recording.sample_rate)
             recording = True
             recording_start_time = time.time()
-            mic_buffer = RingBuffer(SETTINGS.recording.max_duration_seconds, SETTINGS.recording.sample_rate, 1)
-            system_buffer = RingBuffer(SETTINGS.recording.max_duration_seconds, SETTINGS.recording.sample_rate, 2)
+            self.live_encoder = None
+            if SETTINGS.recording.live_encode:
+                self.live_encoder = LiveEncoder(mic_buffer, system_buffer, os.path.join(backup_dir, "output"),
+                    lambda: self.gain, session_clock).start()
             
             self.rec_btn.configure(text=f"⏹️ {t('stop')}", fg_color=THEME.colors.secondary)
             
-            backup_dir = os.path.join(SETTINGS.paths.recordings, datetime.now().strftime('%Y%m%d_%H%M%S'))
-            os.makedirs(backup_dir, exist_ok=True)
-            self.backup_dir = backup_dir
-            
-            threading.Thread(target=record_from_mic, args=(self,), daemon=True).start()
-            threading.Thread(target=record_system_audio, args=(self,), daemon=True).start()
+            self.capture_threads = [
+                threading.Thread(target=record_from_mic, args=(self,), daemon=True),
+                threading.Thread(target=record_system_audio, args=(self,), daemon=True),
+            ]
+            for thread in self.capture_threads:
+                thread.start()
             
             # 音声認識を開始
             if self.speech_var.get():
@@ -1177,66 +3353,73 @@ class RecordingFrame(ctk.CTkFrame):
             
             def finalize():
                 try:
-                    mic_data = mic_buffer.get_all_data()
-                    sys_data = system_buffer.get_all_data()
-                    mixed = mix_audio(mic_data, sys_data)
+                    # キャプチャスレッドの終了を待ってからキューの残りを書き出す
+                    for thread in self.capture_threads:
+                        thread.join(timeout=2)
+                    self.capture_pump.stop()
+                    mic_hub.close()
+                    system_hub.close()
+                    print(f"Capture queue overruns: mic={mic_queue.overruns}, system={system_queue.overruns}")
+                    mic_buffer.close()
+                    system_buffer.close()
+                    empty = len(mic_buffer) == 0 and len(system_buffer) == 0
+                    if self.live_encoder:
+                        # 録音中にエンコード済みなので残りを書き出すだけ
+                        final = self.live_encoder.stop()
+                        if empty and final:
+                            # 音声のない空のファイルは残さない
+                            try:
+                                os.remove(final)
+                            except OSError:
+                                pass
+                            final = None
+                    else:
+                        delay = None
+                        if SETTINGS.recording.auto_mic_delay:
+                            # 推定値はこの保存だけに使う（設定値は変えない）
+                            delay = estimate_mic_delay(mic_buffer, system_buffer, SETTINGS.recording.sample_rate)
+                            print(f"Estimated mic delay: {delay}ms")
+                        # ミックス・ゲイン・クリッピング防止をしながらMP3へ直接エンコード
+                        final = save_mixed_recording(mic_buffer, system_buffer, self.gain,
+                            os.path.join(self.backup_dir, "output"), delay)
                     
-                    if len(mixed) > 0:
-                        wav_path = os.path.join(self.backup_dir, "output.wav")
-                        # 音量調整（ゲイン適用）
-                        gain = volume_gain.get()
-                        mixed = mixed * gain
-                        # クリッピング防止
-                        peak = float(np.max(np.abs(mixed)))
-                        if peak > 0.95:
-                            mixed = (mixed / peak) * 0.95
-                        sf.write(wav_path, mixed, SETTINGS.recording.sample_rate, subtype='PCM_16')
-                        
-                        final = wav_path
-                        # MP3変換
-                        mp3_path = os.path.join(self.backup_dir, "output.mp3")
-                        try:
-                            ffmpeg = find_ffmpeg()
-                            startupinfo = None
-                            if os.name == 'nt':
-                                startupinfo = subprocess.STARTUPINFO()
-                                startupinfo.dwFlags |= subprocess.STARTF_USESHOWWINDOW
-                                startupinfo.wShowWindow = subprocess.SW_HIDE
-                            subprocess.run([ffmpeg or 'ffmpeg', '-y', '-hide_banner', '-loglevel', 'error',
-                                '-i', wav_path, '-codec:a', 'libmp3lame', '-b:a', '192k', mp3_path], 
-                                capture_output=True, startupinfo=startupinfo)
-                            if os.path.exists(mp3_path):
-                                os.remove(wav_path)
-                                final = mp3_path
-                        except:
-                            audio = AudioSegment.from_wav(wav_path)
-                            audio.export(mp3_path, format='mp3', bitrate='192k')
-                            os.remove(wav_path)
-                            final = mp3_path
-                        
+                    if final or empty:
+                        # 保存が完了した（または保存する音声がない）のでセッションファイルは不要
+                        mic_buffer.discard()
+                        system_buffer.discard()
+                        remove_session_manifest(self.backup_dir)
+                    if empty:
+                        print("No audio was recorded; session discarded")
+                    if final:
                         global last_recording_path
                         last_recording_path = final
-                        self.after(0, lambda: messagebox.showinfo(t("recording_complete"), f"保存: {os.path.abspath(final)}"))
+                        ui_channel.post(lambda: messagebox.showinfo(t("recording_complete"), f"保存: {os.path.abspath(final)}"))
                         
                         def update_ui():
                             try:
                                 self.master.master.history_frame.refresh()
                             except: pass
-                        self.after(100, update_ui)
+                        ui_channel.post(update_ui)
                 except Exception as e:
                     traceback.print_exc()
-                    self.after(0, lambda: messagebox.showerror(t("error"), str(e)))
+                    ui_channel.post(lambda e=e: messagebox.showerror(t("error"), str(e)))
                 finally:
-                    self.after(0, lambda: self.rec_btn.configure(text=f"⏺️ {t('recording')}", state="normal", fg_color=THEME.colors.danger))
-                    self.after(0, lambda: self.label_time.configure(text="00:00:00", text_color=THEME.colors.text))
+                    ui_channel.post(lambda: self.rec_btn.configure(text=f"⏺️ {t('recording')}", state="normal", fg_color=THEME.colors.danger))
+                    ui_channel.post(lambda: self.label_time.configure(text="00:00:00", text_color=THEME.colors.text))
             
             threading.Thread(target=finalize, daemon=True).start()
     
+    def _stop_at_limit(self):
+        if recording:
+            print(f"Max duration reached ({SETTINGS.recording.max_duration_seconds}s), stopping...")
+            self.toggle_recording()
+    
     def toggle_pause(self):
         global pause, recording
         if not recording:
             return
         pause = not pause
+        session_clock.set_paused(pause)
         self.pause_btn.configure(text=f"▶️ {t('resume')}" if pause else f"⏸️ {t('pause')}")
 
 class HistoryFrame(ctk.CTkFrame):
@@ -1299,7 +3482,7 @@ class SettingsWindow(ctk.CTkToplevel):
         super().__init__(parent)
         self.parent = parent
         self.title(t("settings"))
-        self.geometry("550x500")
+        self.geometry("550x800")
         self.transient(parent)
         self.grab_set()
         self.grid_columnconfigure(0, weight=1)
@@ -1330,9 +3513,60 @@ class SettingsWindow(ctk.CTkToplevel):
         ctk.CTkOptionMenu(dur_frame, values=["1", "2", "3", "4"], variable=self.dur_var, command=self.on_dur, width=80).pack(side="left")
         ctk.CTkLabel(dur_frame, text="時間").pack(side="left", padx=10)
         
+        self.live_encode_var = ctk.BooleanVar(value=SETTINGS.recording.live_encode)
+        ctk.CTkCheckBox(frame, text="録音中にMP3へエンコード（停止後の保存が速くなります）", variable=self.live_encode_var,
+            command=self.on_live_encode).grid(row=4, column=0, columnspan=2, padx=10, pady=(0, 5), sticky="w")
+        self.auto_delay_var = ctk.BooleanVar(value=SETTINGS.recording.auto_mic_delay)
+        self.auto_delay_check = ctk.CTkCheckBox(frame, text="保存時にマイク遅延を自動推定（最初の1分から）", variable=self.auto_delay_var,
+            command=self.on_auto_delay)
+        self.auto_delay_check.grid(row=5, column=0, columnspan=2, padx=10, pady=(0, 10), sticky="w")
+        self.on_live_encode()
+        
+        # 文字起こし設定
+        tr_frame = ctk.CTkFrame(self)
+        tr_frame.grid(row=1, column=0, padx=20, pady=10, sticky="ew")
+        tr_frame.grid_columnconfigure(1, weight=1)
+        
+        ctk.CTkLabel(tr_frame, text="📝 文字起こし設定", font=ctk.CTkFont(size=14, weight="bold")).grid(row=0, column=0, columnspan=2, pady=10, sticky="w", padx=10)
+        
+        ctk.CTkLabel(tr_frame, text="マイク:").grid(row=1, column=0, padx=10, pady=5, sticky="w")
+        self.mic_engine_var = ctk.StringVar(value=SETTINGS.transcription.mic_engine)
+        ctk.CTkOptionMenu(tr_frame, values=["google", "vosk"], variable=self.mic_engine_var,
+            command=self.on_mic_engine, width=120).grid(row=1, column=1, padx=10, pady=5, sticky="w")
+        
+        ctk.CTkLabel(tr_frame, text="システム音声:").grid(row=2, column=0, padx=10, pady=5, sticky="w")
+        self.system_engine_var = ctk.StringVar(value=SETTINGS.transcription.system_engine)
+        ctk.CTkOptionMenu(tr_frame, values=["gemini", "vosk"], variable=self.system_engine_var,
+            command=self.on_system_engine, width=120).grid(row=2, column=1, padx=10, pady=5, sticky="w")
+        
+        ctk.CTkLabel(tr_frame, text="Voskモデル:").grid(row=3, column=0, padx=10, pady=5, sticky="w")
+        model_frame = ctk.CTkFrame(tr_frame, fg_color="transparent")
+        model_frame.grid(row=3, column=1, padx=10, pady=5, sticky="ew")
+        model_frame.grid_columnconfigure(0, weight=1)
+        self.vosk_model_entry = ctk.CTkEntry(model_frame)
+        self.vosk_model_entry.insert(0, SETTINGS.transcription.vosk_model_path)
+        self.vosk_model_entry.grid(row=0, column=0, sticky="ew")
+        self.vosk_model_entry.bind("<Return>", lambda e: self.on_vosk_model())
+        self.vosk_model_entry.bind("<FocusOut>", lambda e: self.on_vosk_model())
+        ctk.CTkButton(model_frame, text="参照", command=self.browse_vosk_model, width=60).grid(row=0, column=1, padx=(10, 0))
+        
+        ctk.CTkLabel(tr_frame, text="目標の表示遅延:").grid(row=4, column=0, padx=10, pady=5, sticky="w")
+        latency_frame = ctk.CTkFrame(tr_frame, fg_color="transparent")
+        latency_frame.grid(row=4, column=1, padx=10, pady=5, sticky="ew")
+        latency_frame.grid_columnconfigure(0, weight=1)
+        self.latency_var = ctk.IntVar(value=SETTINGS.transcription.target_latency_seconds)
+        latency_slider = ctk.CTkSlider(latency_frame, from_=5, to=30, number_of_steps=25, variable=self.latency_var, command=self.on_latency)
+        latency_slider.grid(row=0, column=0, sticky="ew")
+        latency_slider.bind("<ButtonRelease-1>", lambda e: save_settings())
+        self.latency_label = ctk.CTkLabel(latency_frame, text=f"{SETTINGS.transcription.target_latency_seconds}秒", width=60)
+        self.latency_label.grid(row=0, column=1, padx=(10, 0))
+        
+        ctk.CTkLabel(tr_frame, text="設定は次の録音開始から反映されます（voskはオフラインで動作）",
+            text_color=THEME.colors.text_muted, font=ctk.CTkFont(size=10)).grid(row=5, column=0, columnspan=2, padx=10, pady=(0, 10), sticky="w")
+        
         # Gemini設定
         gemini_frame = ctk.CTkFrame(self)
-        gemini_frame.grid(row=1, column=0, padx=20, pady=10, sticky="ew")
+        gemini_frame.grid(row=2, column=0, padx=20, pady=10, sticky="ew")
         gemini_frame.grid_columnconfigure(1, weight=1)
         
         ctk.CTkLabel(gemini_frame, text="🤖 Gemini API設定", font=ctk.CTkFont(size=14, weight="bold")).grid(row=0, column=0, columnspan=2, pady=10, sticky="w", padx=10)
@@ -1365,7 +3599,7 @@ class SettingsWindow(ctk.CTkToplevel):
         help_btn.pack(side="left")
         
         # 閉じるボタン
-        ctk.CTkButton(self, text="閉じる", command=self.destroy, width=120).grid(row=2, column=0, pady=20)
+        ctk.CTkButton(self, text="閉じる", command=self.destroy, width=120).grid(row=3, column=0, pady=20)
     
     def update_api_status(self):
         if gemini_assistant.is_configured:
@@ -1384,8 +3618,9 @@ class SettingsWindow(ctk.CTkToplevel):
         self.update()
         
         def do_test():
-            success = gemini_assistant.configure(api_key)
-            self.after(0, lambda: self._handle_test_result(success))
+            # 接続テストはキャッシュを使わず必ず再確認する
+            success = gemini_assistant.configure(api_key, revalidate=True)
+            ui_channel.post(lambda: self._handle_test_result(success))
         
         threading.Thread(target=do_test, daemon=True).start()
     
@@ -1417,10 +3652,59 @@ class SettingsWindow(ctk.CTkToplevel):
     
     def on_dur(self, v):
         SETTINGS.recording.max_duration_seconds = int(v) * 3600
+    
+    def on_live_encode(self):
+        SETTINGS.recording.live_encode = self.live_encode_var.get()
+        # 録音中エンコードでは保存時の推定を使えない（ミックス済みのため）
+        self.auto_delay_check.configure(state="disabled" if SETTINGS.recording.live_encode else "normal")
+    
+    def on_auto_delay(self):
+        SETTINGS.recording.auto_mic_delay = self.auto_delay_var.get()
+    
+    def on_mic_engine(self, v):
+        SETTINGS.transcription.mic_engine = v
+        save_settings()
+    
+    def on_system_engine(self, v):
+        SETTINGS.transcription.system_engine = v
+        save_settings()
+    
+    def on_latency(self, v):
+        SETTINGS.transcription.target_latency_seconds = int(v)
+        self.latency_label.configure(text=f"{int(v)}秒")
+    
+    def on_vosk_model(self):
+        path = self.vosk_model_entry.get().strip()
+        if path and path != SETTINGS.transcription.vosk_model_path:
+            SETTINGS.transcription.vosk_model_path = path
+            save_settings()
+    
+    def browse_vosk_model(self):
+        path = filedialog.askdirectory(title="Voskモデルのフォルダを選択", parent=self)
+        if path:
+            self.vosk_model_entry.delete(0, "end")
+            self.vosk_model_entry.insert(0, path)
+            self.on_vosk_model()
+
+def benchmark_startup(app):
+    """ウィンドウが表示されるまでの時間を計測し、目標時間と比較して終了"""
+    def measure():
+        app.update()
+        elapsed_ms = (time.perf_counter() - _PROCESS_START) * 1000
+        budget_ms = SETTINGS.ui.startup_budget_ms
+        print(f"Startup: {elapsed_ms:.0f} ms (budget {budget_ms} ms)")
+        app.exit_code = 0 if elapsed_ms <= budget_ms else 1
+        app.destroy()
+    app.exit_code = 0
+    app.after_idle(measure)
+    app.mainloop()
+    return app.exit_code
 
 def main():
     os.makedirs(SETTINGS.paths.recordings, exist_ok=True)
     app = MeetLogApp()
+    if "--benchmark-startup" in sys.argv:
+        sys.exit(benchmark_startup(app))
     app.mainloop()
 
 if __name__ == "__main__":
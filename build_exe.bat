@@ -30,6 +30,7 @@ echo Using Python: %VENV_PYTHON%
 echo.
 
 REM Use --onedir for better compatibility with google-generativeai
+REM Audio backends are loaded lazily via importlib, so they are listed as hidden imports
 %VENV_PYINSTALLER% --name MeetLog --onedir --windowed --noconfirm --clean --icon=icon.ico ^
     --additional-hooks-dir=. ^
     --add-data "icon.ico;." --add-data "ja.json;." --add-data "en.json;." ^
@@ -60,6 +61,14 @@ REM Use --onedir for better compatibility with google-generativeai
     --hidden-import=certifi ^
     --hidden-import=proto ^
     --hidden-import=proto.marshal ^
+    --collect-all soundcard ^
+    --collect-all speech_recognition ^
+    --collect-all vosk ^
+    --hidden-import=soundcard ^
+    --hidden-import=speech_recognition ^
+    --hidden-import=pyaudiowpatch ^
+    --hidden-import=pyaudio ^
+    --hidden-import=vosk ^
     MeetLog.py
 
 echo.